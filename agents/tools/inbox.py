@@ -14,29 +14,111 @@ Usage:
 
 import argparse
 import hashlib
+import os
 import re
-import shutil
 import sys
 import tempfile
+from contextlib import ExitStack, contextmanager, nullcontext
 from datetime import date
 from pathlib import Path
 
-from filelock import FileLock
-from rich.console import Console
-from rich.markdown import Markdown
-from rich.panel import Panel
+# rich and filelock are imported lazily: together they cost ~250ms of startup,
+# which every agent-facing JSON call (peek, wait, ...) would otherwise pay
 
-console = Console()
+
+class LazyConsole:
+    """
+    Stand-in for rich's Console that defers importing rich until needed.
+
+    Plain-string prints to a non-terminal (agents reading a pipe) strip the
+    markup exactly like rich's tag syntax and are written directly, without
+    rich's 80-column soft wrapping. Terminals and renderables (Panels) get a
+    real Console, created on first use. With stderr=True everything goes
+    to stderr instead (progress lines beside JSON on stdout).
+    """
+
+    # Same tag grammar as rich.markup: optional backslash escapes, then [tag]
+    _TAG_RE = re.compile(r"(\\*)\[([a-z#/@][^[]*?)]")
+
+    def __init__(self, stderr: bool = False):
+        self._console = None
+        self.stderr = stderr
+
+    def _rich(self):
+        if self._console is None:
+            from rich.console import Console
+
+            self._console = Console(stderr=self.stderr)
+        return self._console
+
+    @classmethod
+    def strip_markup(cls, text: str) -> str:
+        def replace(match: re.Match) -> str:
+            backslashes, escaped = divmod(len(match.group(1)), 2)
+            # Odd backslash count escapes the tag: keep it literally
+            return "\\" * backslashes + (f"[{match.group(2)}]" if escaped else "")
+
+        return cls._TAG_RE.sub(replace, text)
+
+    def print(self, *objects, **kwargs) -> None:
+        stream = sys.stderr if self.stderr else sys.stdout
+        if kwargs or not all(isinstance(obj, str) for obj in objects) or stream.isatty():
+            self._rich().print(*objects, **kwargs)
+            return
+        print(" ".join(self.strip_markup(obj) for obj in objects), file=stream)
+
+
+console = LazyConsole()
 
 VALID_ROLES = ["coach", "desk", "comms", "meta", "external"]
 VALID_PRIORITIES = ["HIGH", "MEDIUM", "LOW"]
 INBOX_DIR = Path("agents/state/inboxes")
 SESSIONS_DIR = Path("agents/state/sessions")
+# Handled items leave the hot inbox for gzip JSONL segments, one per role per month
+ARCHIVE_DIR = INBOX_DIR / "archive"
 
 # Lock timeout: long enough for slow filesystems, short enough to detect crashes
 # FileLock auto-releases on process exit, protecting against crashed processes
 LOCK_TIMEOUT = 30  # seconds
 
+# Durability of inbox writes (INBOX_DURABILITY env var or --durability):
+#   none           - rely on the OS to flush (fastest; a power loss may lose recent writes)
+#   fsync-file     - fsync inbox data before it becomes visible
+#   fsync-file+dir - also fsync the directory so renames/creations survive power loss
+# Writes are atomic (same-directory temp file + os.replace) in every mode.
+DURABILITY_MODES = ["none", "fsync-file", "fsync-file+dir"]
+DURABILITY = os.environ.get("INBOX_DURABILITY", "none")
+
+# Storage backend (INBOX_BACKEND env var or --backend): "markdown" keeps one
+# {role}.md file per inbox; "sqlite" keeps every inbox in a WAL-mode database
+BACKENDS = ["markdown", "sqlite", "maildir"]
+BACKEND = os.environ.get("INBOX_BACKEND", "markdown")
+
+# Dequeue order for peek/wait (INBOX_ORDER env var or --order): "fifo" returns
+# the oldest eligible item; "priority" returns HIGH before MEDIUM before LOW,
+# oldest first within a priority (optionally aged, see effective_rank)
+DEQUEUE_ORDERS = ["fifo", "priority"]
+DEQUEUE_ORDER = os.environ.get("INBOX_ORDER", "fifo")
+
+# Idempotency keys (add --key / --dedup) are remembered this long, so a retry
+# within the window returns the original item instead of enqueuing a copy
+DEDUP_WINDOW_DAYS = 7
+
+# Default claim lease for take, wait --claim and consume (INBOX_LEASE env var
+# or --lease), in seconds. A claim whose lease has run out is available again
+# to peek/wait/take; holders extend it with `renew`. 0 means claims never
+# expire. A plain `claim` only gets a lease when given --lease.
+LEASE_SECONDS = int(os.environ.get("INBOX_LEASE", "3600"))
+
+# Bodies larger than this many bytes (INBOX_BLOB_THRESHOLD) are stored out of
+# line in BLOB_DIR, named by their SHA-256, and the inbox keeps only a
+# **Blob:** reference, so scans never read them. 0 keeps every body inline.
+BLOB_THRESHOLD = int(os.environ.get("INBOX_BLOB_THRESHOLD", "16384"))
+BLOB_DIR = INBOX_DIR / "blobs"
+# Unreferenced blobs younger than this survive `compact`: an add may have
+# stored its blob and not yet appended the item that refers to it
+BLOB_GRACE_SECONDS = 3600
+
 # Role-based default timeouts for `wait` command (seconds)
 # Oracle runs daemon mode (long polling), engineer waits for quick responses
 ROLE_TIMEOUTS = {
@@ -48,15 +130,128 @@ ROLE_TIMEOUTS = {
 }
 
 
-def generate_item_id(title: str, from_agent: str, date_str: str, priority: str) -> str:
+# `wait` wake-ups: inotify when available, otherwise poll every POLL_INTERVAL.
+# With inotify, WATCH_RECHECK is a safety net for missed events (e.g. network
+# filesystems that don't deliver them), not the normal wake-up path.
+POLL_INTERVAL = 5  # seconds
+WATCH_RECHECK = 60  # seconds
+
+# Opt-in timing trace (INBOX_TRACE=path, --trace or --trace-file path): one JSON line per command,
+# broker request or consume worker, aggregated by `inbox.py trace-report`
+TRACE_PATH = os.environ.get("INBOX_TRACE") or None
+DEFAULT_TRACE_PATH = INBOX_DIR / "trace.jsonl"
+TRACE_PHASES = ["startup", "lock_wait", "lock_hold", "read", "parse", "format", "write", "broker", "idle"]
+_trace_local = None  # threading.local holding the record being filled, once tracing starts
+
+
+def file_lock(lock_path: Path):
+    """FileLock on an inbox lock file; filelock is imported on first use."""
+    from filelock import FileLock
+
+    return FileLock(lock_path, timeout=LOCK_TIMEOUT)
+
+
+def process_age_ms() -> float | None:
+    """Milliseconds since this process started (Linux /proc; 10ms resolution)."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, (uptime - start_ticks / os.sysconf("SC_CLK_TCK")) * 1000)
+
+
+def trace_record() -> dict | None:
+    """The trace record this thread is filling, or None when not tracing."""
+    if _trace_local is None:
+        return None
+    return getattr(_trace_local, "record", None)
+
+
+def trace_begin(command: str, role: str | None = None, startup: bool = False) -> None:
+    """Start this thread's trace record (no-op unless TRACE_PATH is set)."""
+    global _trace_local
+    if TRACE_PATH is None:
+        return
+    import threading
+    import time
+
+    if _trace_local is None:
+        _trace_local = threading.local()
+    record = {"cmd": command, "role": role, "backend": BACKEND, "pid": os.getpid()}
+    if startup:
+        # Interpreter start, imports and argument parsing, before the command runs
+        record["startup_ms"] = process_age_ms()
+    record["_start"] = time.perf_counter()
+    _trace_local.record = record
+
+
+def trace_end(**fields) -> None:
+    """Finish this thread's trace record and append it to TRACE_PATH as one JSON line."""
+    import json
+    import time
+    from datetime import datetime, timezone
+
+    record = trace_record()
+    if record is None:
+        return
+    _trace_local.record = None
+    record["total_ms"] = (time.perf_counter() - record.pop("_start")) * 1000
+    record.update(fields)
+    record = {k: round(v, 3) if isinstance(v, float) else v for k, v in record.items()}
+    record["ts"] = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+    path = Path(TRACE_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # One O_APPEND write per record: concurrent processes never interleave lines
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + "\n").encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def traced(phase: str):
+    """Add the time spent in the block to the current record's `{phase}_ms`."""
+    record = trace_record()
+    if record is None:
+        yield
+        return
+    import time
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        key = f"{phase}_ms"
+        record[key] = record.get(key, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def trace_count(name: str, count: int = 1) -> None:
+    """Add `count` to a counter (e.g. items_scanned) on the current record."""
+    record = trace_record()
+    if record is not None:
+        record[name] = record.get(name, 0) + count
+
+
+def generate_item_id(
+    title: str, from_agent: str, date_str: str, priority: str, salt: str = ""
+) -> str:
     """
-    Generate a stable 7-char ID for an inbox item.
+    Generate a 7-char ID for an inbox item.
 
-    Hash is based on: title + date + from + priority
+    Hash is based on: title + date + from + priority (+ salt)
     Uses first 7 chars of SHA256 (like git commit hashes).
+    Unsalted IDs are stable (migration of ID-less items); new items are
+    salted so identical messages still get distinct IDs (see assign_item_ids).
     """
     # Create stable input for hashing
     input_str = f"{title}|{date_str}|{from_agent}|{priority}"
+    if salt:
+        input_str += f"|{salt}"
 
     # Generate hash and take first 7 chars
     hash_obj = hashlib.sha256(input_str.encode("utf-8"))
@@ -68,167 +263,2492 @@ def get_inbox_path(role: str) -> Path:
     return INBOX_DIR / f"{role}.md"
 
 
+def get_dedup_path(role: str) -> Path:
+    """Get path to the idempotency-key index for a role's inbox."""
+    return INBOX_DIR / f"{role}.dedup.json"
+
+
+def get_blob_path(digest: str) -> Path:
+    """Content-addressed path of a body blob: blobs/{first 2 hex}/{sha256}."""
+    return BLOB_DIR / digest[:2] / digest
+
+
 def get_next_session_id(role: str) -> str:
     """
     Generate session ID using PID+timestamp (naturally unique).
 
     Format: {role}-{YYYY-MM-DD}-{PID}-{timestamp}
 
-    Uses process ID + millisecond timestamp to ensure uniqueness
-    without filesystem reads or coordination.
-    """
-    import os
-    import time
+    Uses process ID + millisecond timestamp to ensure uniqueness
+    without filesystem reads or coordination.
+    """
+    import time
+
+    today = date.today().isoformat()
+    pid = os.getpid()
+    timestamp = int(time.time() * 1000) % 100000  # Last 5 digits ms
+
+    return f"{role}-{today}-{pid}-{timestamp}"
+
+
+def parse_inbox(content: str) -> list[dict]:
+    """
+    Parse inbox markdown into structured items.
+
+    Auto-generates IDs for items that don't have them (migration).
+    """
+    items = []
+
+    # Split on --- separators
+    for part in re.split(r"\n---\n", content):
+        item = parse_block(part)
+        if item:
+            items.append(item)
+
+    return items
+
+
+# Item header: optional "## Title" line, then consecutive "**Key:** value"
+# metadata lines. One anchored match per block; the body is whatever follows.
+ITEM_HEADER_RE = re.compile(
+    r"(?:## (?P<title>[^\n]+)(?:\n[ \t]*)*\n)?"
+    r"(?P<meta>(?:\*\*[A-Za-z][A-Za-z -]*:\*\*[^\n]*(?:\n|$))*)"
+)
+META_PAIR_RE = re.compile(r"^\*\*([A-Za-z][A-Za-z -]*):\*\*[ \t]*(.*)$", re.MULTILINE)
+# format_item always writes these; a header run missing one is hand-edited or
+# legacy, and parse_block falls back to searching the whole block per field
+HEADER_FIELDS = frozenset(("ID", "From", "Date", "Priority"))
+LOOSE_FIELDS = ("ID", "From", "Date", "Priority", "In-Reply-To", "Status", "Claimed At", "Lease Until", "Blob")
+LOOSE_FIELD_RES = {key: re.compile(rf"\*\*{key}:\*\*[ \t]*([^\n]*)") for key in LOOSE_FIELDS}
+LOOSE_TITLE_RE = re.compile(r"^## (.+)$", re.MULTILINE)
+ITEM_ID_RE = re.compile(r"[a-f0-9]{7}")
+BLOB_ID_RE = re.compile(r"[a-f0-9]{64}")
+
+
+def parse_block(part: str) -> dict | None:
+    """
+    Parse one separator-delimited block of an inbox file.
+
+    Single pass with precompiled patterns: one anchored match covers the
+    "## " title and the consecutive "**Key:** value" metadata lines; the rest
+    of the block is the body, sliced out once and never rescanned.
+    Round-trips format_item output exactly; unlike searching the whole
+    block per field, metadata-looking lines inside a body are left alone.
+    Blocks whose header run lacks one of HEADER_FIELDS (blank lines between
+    fields, text before them) are read the legacy way instead: each field
+    from its first occurrence anywhere, the body after the last one found.
+
+    Returns the item, or None if the block holds no item (header, blank,
+    legacy comment). An item whose body is a blob gets "blob" (the digest)
+    instead of "body"; see item_body.
+    """
+    part = part.strip()
+    if not part:
+        return None
+    # Remove header line if present, keep rest of block
+    if part.startswith("# "):
+        newline = part.find("\n")
+        if newline == -1:
+            return None  # Only header, no content
+        part = part[newline + 1 :].strip()
+    if not part:
+        return None
+    # Skip HTML comments (legacy template format)
+    if part.startswith("<!--") and part.endswith("-->"):
+        return None
+
+    header = ITEM_HEADER_RE.match(part)
+    title = header.group("title")
+    meta: dict[str, str] = {}
+    for key, value in META_PAIR_RE.findall(header.group("meta")):
+        meta.setdefault(key, value.strip())  # First occurrence wins
+    body_start = header.end()
+    if not HEADER_FIELDS <= meta.keys():
+        title_match = LOOSE_TITLE_RE.search(part)
+        title = title_match.group(1) if title_match else None
+        body_start = title_match.end() if title_match else 0
+        for key, pattern in LOOSE_FIELD_RES.items():
+            match = pattern.search(part)
+            if match:
+                meta[key] = match.group(1).strip()
+                body_start = max(body_start, match.end())
+
+    # Extract values
+    title = title or "Untitled"
+    from_agent = meta.get("From") or "Unknown"
+    date_str = meta.get("Date") or str(date.today())
+    priority = meta.get("Priority") or "MEDIUM"
+    in_reply_to = meta.get("In-Reply-To")
+    if in_reply_to and not ITEM_ID_RE.fullmatch(in_reply_to):
+        in_reply_to = None
+    status = meta.get("Status", "")
+    status = status.removeprefix("CLAIMED by ").strip() if status.startswith("CLAIMED by ") else None
+    status = status or None
+    claimed_at = meta.get("Claimed At") or None
+    lease_until = meta.get("Lease Until") or None
+    blob = meta.get("Blob")
+
+    # Get or generate ID
+    item_id = meta.get("ID")
+    if not item_id or not ITEM_ID_RE.fullmatch(item_id):
+        # Auto-generate ID for migration
+        item_id = generate_item_id(title, from_agent, date_str, priority)
+
+    # Body: everything after the header lines; unescape --- escaped during write
+    body = unescape_body_separators(part[body_start:].strip())
+
+    item = {
+        "id": item_id,
+        "title": title,
+        "from": from_agent,
+        "date": date_str,
+        "priority": priority,
+        "in_reply_to": in_reply_to,  # Thread correlation for responses
+        "status": status,  # None if unclaimed, session-id if claimed
+        "claimed_at": claimed_at,  # ISO 8601 timestamp or None
+        "lease_until": lease_until,  # Claim expiry (ISO 8601) or None
+    }
+    if blob and BLOB_ID_RE.fullmatch(blob):
+        item["blob"] = blob  # Body stays on disk until something emits it
+    else:
+        item["body"] = body
+    return item
+
+
+def escape_body_separators(body: str) -> str:
+    """Escape --- in body to prevent parse_inbox from splitting on it."""
+    # Replace \n---\n with \n-​-​-\n (using zero-width spaces)
+    # This preserves visual appearance while preventing split
+    return body.replace("\n---\n", "\n-\u200b-\u200b-\n")
+
+
+def unescape_body_separators(body: str) -> str:
+    """Unescape --- in body after parsing."""
+    return body.replace("\n-\u200b-\u200b-\n", "\n---\n")
+
+
+def format_item(item: dict) -> str:
+    """Format an item as markdown with ID and optional claimed status."""
+    lines = [
+        f"## {item['title']}",
+        "",
+        f"**ID:** {item['id']}",
+        f"**From:** {item['from']}",
+        f"**Date:** {item['date']}",
+        f"**Priority:** {item['priority']}",
+    ]
+    # Add in_reply_to if present (for response threading)
+    if item.get("in_reply_to"):
+        lines.append(f"**In-Reply-To:** {item['in_reply_to']}")
+    # Add status line if claimed
+    if item.get("status"):
+        lines.append(f"**Status:** CLAIMED by {item['status']}")
+    # Add claimed_at timestamp if present
+    if item.get("claimed_at"):
+        lines.append(f"**Claimed At:** {item['claimed_at']}")
+    if item.get("lease_until"):
+        lines.append(f"**Lease Until:** {item['lease_until']}")
+    if item.get("blob"):
+        lines.append(f"**Blob:** {item['blob']}")
+    elif item.get("body"):
+        lines.append("")
+        # Escape --- to prevent splitting issues
+        lines.append(escape_body_separators(item["body"]))
+    return "\n".join(lines)
+
+
+def store_blob(body: str) -> str:
+    """
+    Write a body to the blob store and return its SHA-256 digest.
+
+    Content-addressed: identical bodies share one file, and storing a body
+    that is already there only refreshes its mtime (see prune_blobs). The
+    file is published by rename and its directory synced before the caller
+    writes the item that refers to it.
+    """
+    data = body.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    path = get_blob_path(digest)
+    try:
+        os.utime(path)
+        return digest
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with traced("write"):
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                sync_file(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        sync_directory(path.parent)
+    return digest
+
+
+def read_blob(digest: str) -> str:
+    """A blob's text, decoded straight from a read-only mapping of the file."""
+    import mmap
+
+    try:
+        with traced("read"), open(get_blob_path(digest), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""  # mmap can't map an empty file
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return str(data, "utf-8")
+    except FileNotFoundError:
+        raise InboxError(f"Body blob {digest} is missing from {BLOB_DIR}.") from None
+
+
+def spill_body(item: dict) -> dict:
+    """
+    The item as it should be written: a body over BLOB_THRESHOLD bytes is
+    moved into the blob store and the copy returned carries its "blob".
+    """
+    body = item.get("body")
+    # Cheap length test first: a UTF-8 character is at most 4 bytes
+    if BLOB_THRESHOLD and body and not item.get("blob") and len(body) * 4 > BLOB_THRESHOLD:
+        body = body.strip()  # Same normalization the inline round trip applies
+        if len(body.encode("utf-8")) > BLOB_THRESHOLD:
+            return {**item, "blob": store_blob(body)}
+    return item
+
+
+def item_body(item: dict) -> str:
+    """An item's body, read from its blob (once per item dict) if stored out of line."""
+    if "body" not in item:
+        item["body"] = read_blob(item["blob"])
+    return item["body"]
+
+
+def inline_body(item: dict) -> dict:
+    """Copy of an item with its body in line and no blob reference (output, archive)."""
+    output = {key: value for key, value in item.items() if key != "blob"}
+    output["body"] = item_body(item)
+    return output
+
+
+def prune_blobs(min_age: float = BLOB_GRACE_SECONDS) -> int:
+    """
+    Delete blobs no inbox refers to any more (their items were archived with
+    the body in line). Blobs touched within `min_age` seconds are kept, since
+    a writer may be about to reference them. Returns the number deleted.
+    """
+    import time
+
+    store = get_store()
+    referenced = {item["blob"] for role in VALID_ROLES for item in store.load(role) if item.get("blob")}
+    cutoff = time.time() - min_age
+    pruned = 0
+    for path in BLOB_DIR.glob("*/*"):
+        try:
+            if BLOB_ID_RE.fullmatch(path.name) and path.name not in referenced:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    pruned += 1
+        except FileNotFoundError:
+            pass
+    return pruned
+
+
+def stat_key(st) -> list[int]:
+    """Identity of one inbox file version: inode, size, mtime (ns).
+
+    Writers replace the file (new inode) or append (new size), so an index
+    recorded under the same key describes exactly the bytes on disk.
+    """
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+def priority_queues(entries: list[dict]) -> dict[str, list[int]]:
+    """
+    Positions of items that are, or may become, available per priority, in
+    document order: unclaimed items and leased claims (which expire).
+
+    Part of build_lookups, so priority dequeue starts at the head of each
+    queue instead of scanning the inbox. Unknown priorities queue as LOW.
+    """
+    queues = {priority: [] for priority in VALID_PRIORITIES}
+    for pos, entry in enumerate(entries):
+        if not entry.get("status") or entry.get("lease_until"):
+            priority = entry.get("priority")
+            queues[priority if priority in queues else "LOW"].append(pos)
+    return queues
+
+
+def build_lookups(entries: list[dict]) -> dict:
+    """
+    Secondary indexes over an inbox's items, by position in document order.
+
+    queues: priority_queues; id: ID -> first position; from: sender role ->
+    positions; in_reply_to: parent ID -> positions. Built once per parse
+    (and memoized with it) so lookups by ID, sender or thread skip the
+    linear scan.
+    """
+    by_id: dict[str, int] = {}
+    by_from: dict[str, list[int]] = {}
+    by_reply: dict[str, list[int]] = {}
+    for pos, entry in enumerate(entries):
+        by_id.setdefault(entry["id"], pos)
+        by_from.setdefault(entry.get("from", "").lower().split(":")[0], []).append(pos)
+        if entry.get("in_reply_to"):
+            by_reply.setdefault(entry["in_reply_to"], []).append(pos)
+    return {
+        "queues": priority_queues(entries),
+        "id": by_id,
+        "from": by_from,
+        "in_reply_to": by_reply,
+    }
+
+
+# Per-process memo of the last inbox version loaded: role -> (key, items, lookups).
+# Long-lived processes (the broker) answer repeat reads with a single stat().
+_loaded: dict[str, tuple[list[int], list[dict], dict]] = {}
+
+
+def load_inbox(role: str) -> list[dict]:
+    """Return parsed items for a role (see load_inbox_indexed)."""
+    return load_inbox_indexed(role)[0]
+
+
+def load_inbox_indexed(role: str) -> tuple[list[dict], dict]:
+    """
+    Return parsed items and their build_lookups, parsing only when the file changed.
+
+    The file is read through one descriptor and keyed by fstat, so the
+    bytes and key describe the same inbox version even if a writer replaces
+    or appends to the file concurrently. The parse is memoized per process
+    under that key (_loaded).
+
+    Returned item dicts are copies; callers may mutate them freely. The
+    lookups are shared and must be treated as read-only. Items whose body
+    is a blob carry "blob" and no "body" (see item_body).
+    """
+    inbox_path = get_inbox_path(role)
+    try:
+        memo = _loaded.get(role)
+        if memo and memo[0] == stat_key(inbox_path.stat()):
+            trace_count("items_scanned", len(memo[1]))
+            return [dict(item) for item in memo[1]], memo[2]
+        f = open(inbox_path, "rb")
+    except FileNotFoundError:
+        return [], build_lookups([])
+    with traced("read"), f:
+        key = stat_key(os.fstat(f.fileno()))
+        data = f.read(key[1])
+
+    with traced("parse"):
+        items = parse_inbox(data.decode("utf-8", errors="replace"))
+        lookups = build_lookups(items)
+    trace_count("items_scanned", len(items))
+    _loaded[role] = (key, items, lookups)
+    return [dict(item) for item in items], lookups
+
+
+def inbox_header(role: str) -> str:
+    """Header block written at the top of every inbox file."""
+    return f"# {role.capitalize()} Inbox\n\n---\n\n"  # Always --- after header
+
+
+def render_inbox(role: str, items: list[dict]) -> str:
+    """Full markdown text of an inbox (header plus one block per item)."""
+    header = inbox_header(role)
+    if items:
+        body = "\n\n---\n\n".join(format_item(item) for item in items)
+        return header + body + "\n\n---\n\n"
+    return header
+
+
+def sync_file(fd: int) -> None:
+    """fsync an inbox file descriptor if the durability mode asks for it."""
+    if DURABILITY != "none":
+        os.fsync(fd)
+
+
+def sync_directory(directory: Path = INBOX_DIR) -> None:
+    """fsync a directory (making renames durable) in fsync-file+dir mode."""
+    if DURABILITY != "fsync-file+dir":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_inbox(role: str, items: list[dict], sync_dir: bool = True) -> None:
+    """
+    Write items to inbox file atomically.
+
+    The temp file lives in the inbox directory so os.replace is a same-
+    filesystem rename, never a copy. Pass sync_dir=False to defer the
+    directory fsync to the caller (group commit across several inboxes).
+    """
+    inbox_path = get_inbox_path(role)
+    inbox_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with traced("format"):
+        content = render_inbox(role, [spill_body(item) for item in items])
+
+    # Atomic write
+    with traced("write"):
+        fd, temp_path = tempfile.mkstemp(dir=inbox_path.parent, prefix=f".{role}.", suffix=".md.tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+                f.flush()
+                sync_file(f.fileno())
+            os.replace(temp_path, inbox_path)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        if sync_dir:
+            sync_directory(inbox_path.parent)
+
+
+def append_inbox_item(role: str, item: dict) -> None:
+    """Append one item to the end of an inbox file (see append_inbox_items)."""
+    append_inbox_items(role, [item])
+
+
+def append_inbox_items(role: str, items: list[dict], sync_dir: bool = True) -> None:
+    """
+    Append items to the end of an inbox file without rewriting it.
+
+    Produces the same layout as write_inbox (each block followed by a ---
+    separator), so parse_inbox reads the result unchanged. Cost depends only
+    on the new items, not the inbox size. Caller must hold the inbox lock.
+
+    All blocks go out in a single O_APPEND write, so lockless readers
+    (peek/wait) see either the old file or the old file plus every new block.
+    sync_dir=False defers the directory fsync for a newly created inbox to
+    the caller, as in write_inbox.
+    """
+    inbox_path = get_inbox_path(role)
+    inbox_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with traced("format"):
+        block = "".join(format_item(spill_body(item)) + "\n\n---\n\n" for item in items)
+    try:
+        old_key = stat_key(inbox_path.stat())
+    except FileNotFoundError:
+        old_key = None
+    size = old_key[1] if old_key else 0
+
+    if size == 0:
+        block = inbox_header(role) + block
+    else:
+        # Only the tail matters: it must end on a separator or the new block
+        # would merge into the last item (e.g. after a hand edit)
+        with open(inbox_path, "rb") as f:
+            f.seek(max(0, size - 8))
+            tail = f.read()
+        if not (tail.endswith(b"\n---\n") or tail.endswith(b"\n---\n\n")):
+            block = "\n\n---\n\n" + block
+
+    data = block.encode("utf-8")
+    with traced("write"):
+        fd = os.open(inbox_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+            sync_file(fd)
+        finally:
+            os.close(fd)
+        if old_key is None and sync_dir:
+            sync_directory(inbox_path.parent)  # New file: its directory entry must persist too
+
+
+def patch_lease(role: str, item: dict) -> bool:
+    """
+    Overwrite an item's **Lease Until:** value in place (no rewrite).
+
+    Only possible when the new value has the same width as the one on disk,
+    which holds for leases written by lease_deadline. The value is looked
+    for only in the metadata header of an item block (the "## " line right
+    after a --- separator) with this ID and claim, never in a body or in
+    another copy of a repeated ID. Keeps this process's memoized parse
+    valid. Returns False when the caller must rewrite instead. Caller must
+    hold the inbox lock.
+    """
+    inbox_path = get_inbox_path(role)
+    try:
+        fd = os.open(inbox_path, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        old_key = stat_key(os.fstat(fd))
+        data = os.pread(fd, old_key[1], 0)
+        marker = b"\n**Lease Until:** "
+        id_line = f"\n\n**ID:** {item['id']}\n".encode()
+        claim_line = f"\n**Status:** CLAIMED by {item['status']}\n".encode()
+        lease_pos = -1
+        pos = data.find(id_line)
+        while pos != -1 and lease_pos == -1:
+            header_end = data.find(b"\n\n", pos + len(id_line))
+            header_end = len(data) if header_end == -1 else header_end + 1
+            if is_item_header(data, pos) and data.find(claim_line, pos, header_end) != -1:
+                lease_pos = data.find(marker, pos, header_end)
+                if lease_pos == -1:
+                    return False
+            pos = data.find(id_line, pos + 1)
+        if lease_pos == -1:
+            return False
+        start = lease_pos + len(marker)
+        end = data.find(b"\n", start)
+        new_value = item["lease_until"].encode()
+        if end - start != len(new_value):
+            return False
+        with traced("write"):
+            os.pwrite(fd, new_value, start)
+            sync_file(fd)
+        new_key = stat_key(os.fstat(fd))
+    finally:
+        os.close(fd)
+
+    memo = _loaded.get(role)
+    if memo and memo[0] == old_key:
+        # Only one lease changed: the lookups (and every other item) still hold
+        items = list(memo[1])
+        for pos in range(memo[2]["id"][item["id"]], len(items)):
+            if items[pos]["id"] == item["id"] and items[pos]["status"] == item["status"]:
+                items[pos] = {**items[pos], "lease_until": item["lease_until"]}
+                break
+        _loaded[role] = (new_key, items, memo[2])
+    return True
+
+
+def is_item_header(data: bytes, id_pos: int) -> bool:
+    """
+    True if the ID line found at `id_pos` (starting with the newline that
+    ends the line before it) sits right under an item's "## " title, and
+    that title opens its block: file start or a --- separator before it.
+    """
+    title_start = data.rfind(b"\n", 0, id_pos) + 1
+    if not data.startswith(b"## ", title_start):
+        return False
+    before = data[max(0, title_start - 16) : title_start].rstrip()
+    return before.endswith(b"\n---") or before == b"---" or title_start == 0
+
+
+def get_archive_dir(role: str) -> Path:
+    """Directory holding a role's archive segments and their index."""
+    return ARCHIVE_DIR / role
+
+
+def read_archive_index(role: str) -> dict:
+    """
+    Load a role's archive index: {"segments": {"YYYY-MM": {...}}}.
+
+    Each segment entry records count, first/last archived_at and the IDs it
+    holds, and "replies" maps a parent ID to the months holding replies to
+    it, so history, ID and thread lookups open only the segments they need.
+    """
+    import json
+
+    try:
+        index = json.loads((get_archive_dir(role) / "index.json").read_text())
+    except (OSError, ValueError):
+        return {"segments": {}}
+    return index if isinstance(index.get("segments"), dict) else {"segments": {}}
+
+
+def archive_items(role: str, items: list[dict], disposition: str, **extra) -> None:
+    """
+    Move handled items into this month's archive segment for `role`.
+
+    Appends one gzip member (JSON lines) to archive/{role}/{YYYY-MM}.jsonl.gz
+    and updates the segment index under archive/{role}/index.lock (the
+    maildir backend has no inbox-wide lock to serialize archive writers
+    for it). `disposition` records why the
+    item left the inbox (deleted, responded, compacted); `extra` fields are
+    stored alongside.
+    """
+    import gzip
+    import json
+    from datetime import datetime, timezone
+
+    if not items:
+        return
+    now = datetime.now(timezone.utc)
+    archived_at = now.isoformat()
+    month = now.strftime("%Y-%m")
+    archive_dir = get_archive_dir(role)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+
+    # Bodies go in line: the archive must not depend on blobs prune_blobs may remove
+    records = [
+        {**inline_body(item), "archived_at": archived_at, "disposition": disposition, **extra}
+        for item in items
+    ]
+    data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+    with file_lock(archive_dir / "index.lock"):
+        # Concatenated gzip members form one valid stream; no need to rewrite the segment
+        with open(archive_dir / f"{month}.jsonl.gz", "ab") as f:
+            f.write(gzip.compress(data))
+            f.flush()
+            sync_file(f.fileno())
+
+        index = read_archive_index(role)
+        segment = index["segments"].setdefault(month, {"count": 0, "first": archived_at, "ids": []})
+        segment["count"] += len(records)
+        segment["last"] = archived_at
+        segment["ids"].extend(record["id"] for record in records)
+        # Parent ID -> months holding replies to it, for thread lookups
+        replies = index.setdefault("replies", {})
+        for record in records:
+            if record.get("in_reply_to"):
+                months = replies.setdefault(record["in_reply_to"], [])
+                if month not in months:
+                    months.append(month)
+
+        fd, temp_path = tempfile.mkstemp(dir=archive_dir, suffix=".idx.tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f)
+        os.replace(temp_path, archive_dir / "index.json")
+
+
+def read_archive(
+    role: str,
+    month: str | None = None,
+    item_id: str | None = None,
+    in_reply_to: str | None = None,
+) -> list[dict]:
+    """
+    Archived items for a role in archive order, optionally one month, one ID
+    or the replies to one ID.
+
+    Only segments the index says are relevant are decompressed; nothing here
+    touches the hot inbox.
+    """
+    import gzip
+    import json
+
+    index = read_archive_index(role)
+    segments = index["segments"]
+    months = sorted(segments)
+    if month:
+        months = [m for m in months if m == month]
+    if item_id:
+        months = [m for m in months if item_id in segments[m].get("ids", [])]
+    if in_reply_to and "replies" in index:  # Older indexes lack it: read every segment
+        months = [m for m in months if m in index["replies"].get(in_reply_to, [])]
+
+    records = []
+    for segment_month in months:
+        path = get_archive_dir(role) / f"{segment_month}.jsonl.gz"
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if item_id and record.get("id") != item_id:
+                        continue
+                    if in_reply_to and record.get("in_reply_to") != in_reply_to:
+                        continue
+                    records.append(record)
+        except (OSError, EOFError):
+            continue  # Missing or truncated segment: skip what can't be read
+    return records
+
+
+def dedup_cutoff() -> str:
+    """Oldest added_at (ISO UTC, second precision) still inside the dedup window."""
+    from datetime import datetime, timedelta, timezone
+
+    return (datetime.now(timezone.utc) - timedelta(days=DEDUP_WINDOW_DAYS)).isoformat(
+        timespec="seconds"
+    )
+
+
+def read_dedup(path: Path) -> dict[str, list[str]]:
+    """Load an idempotency index file: key -> [item ID, added_at]."""
+    import json
+
+    try:
+        known = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return known if isinstance(known, dict) else {}
+
+
+def delivered_ids(store: "InboxStore", role: str, ids: set[str]) -> set[str]:
+    """
+    Which of `ids` the store's inbox holds or the role's archive lists.
+
+    Guards idempotency-key lookups against an index that outlived its
+    inbox (wiped, restored, or another backend's).
+    """
+    found = store.existing_ids(role, ids)
+    if ids - found:
+        segments = read_archive_index(role)["segments"].values()
+        found |= {
+            item_id
+            for item_id in ids - found
+            if any(item_id in segment.get("ids", ()) for segment in segments)
+        }
+    return found
+
+
+def content_key(role: str, spec: dict) -> str:
+    """Idempotency key derived from a message's content (add --dedup)."""
+    content = "\x1f".join([role, spec["title"], spec["from"], spec["priority"], spec["body"]])
+    return "sha256:" + hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+
+class InboxStore:
+    """
+    Storage backend behind the inbox operations.
+
+    A backend keeps each role's items (dicts shaped like parse_block output;
+    read bodies with item_body) in arrival order. Mutations happen inside lock(), which is exclusive
+    across processes for the given roles; load() is safe without it.
+    """
+
+    name = ""
+
+    def lock(self, *roles: str):
+        """Context manager making read-modify-write on `roles` exclusive."""
+        raise NotImplementedError
+
+    def load(self, role: str) -> list[dict]:
+        """All items for a role, oldest first. Returned dicts are the caller's."""
+        raise NotImplementedError
+
+    def append(self, role: str, items: list[dict], sync_dir: bool = True) -> None:
+        """Add items at the end of a role's inbox (caller holds the lock)."""
+        raise NotImplementedError
+
+    def save(
+        self,
+        role: str,
+        items: list[dict],
+        changed: list[dict] = (),
+        removed: list[dict] = (),
+    ) -> None:
+        """
+        Persist a role's item list after in-place edits (caller holds the lock).
+
+        `items` is the complete new list; `changed` and `removed` name the
+        items that were modified or dropped, for backends that update rows
+        rather than rewriting the whole inbox.
+        """
+        raise NotImplementedError
+
+    def sync(self) -> None:
+        """Finish a group commit started with sync_dir=False writes."""
+
+    def save_lease(self, role: str, items: list[dict], item: dict) -> None:
+        """Persist a change to `item`'s lease_until only (caller holds the lock)."""
+        self.save(role, items, changed=[item])
+
+    def existing_ids(self, role: str, ids: set[str]) -> set[str]:
+        """Which of `ids` are already used by items in the role's inbox."""
+        return ids & {item["id"] for item in self.load(role)}
+
+    def dedup_get(self, role: str, keys: set[str]) -> dict[str, str]:
+        """Item IDs recorded for idempotency keys within DEDUP_WINDOW_DAYS."""
+        raise NotImplementedError
+
+    def dedup_put(self, role: str, keys: dict[str, str]) -> None:
+        """Record key -> item ID and drop expired keys (caller holds dedup_lock)."""
+        raise NotImplementedError
+
+    def dedup_lock(self, role: str):
+        """
+        Context manager spanning dedup_get, append and dedup_put for keyed
+        adds, taken inside lock(). Backends whose lock() is exclusive need
+        nothing more.
+        """
+        return nullcontext()
+
+    def load_indexed(self, role: str) -> tuple[list[dict], dict]:
+        """Items for a role plus their build_lookups (read-only)."""
+        items = self.load(role)
+        return items, build_lookups(items)
+
+    def find(self, role: str, item_id: str, accept=None) -> tuple[list[dict], int | None]:
+        """
+        Items to edit and pass to save(), plus the position of `item_id` among
+        them (None if absent). Backends whose save() only touches `changed`
+        and `removed` may return just the matching item.
+
+        IDs written before salting can repeat; `accept` picks the first copy
+        it returns true for, and save() then changes that copy.
+        """
+        items, lookups = self.load_indexed(role)
+        pos = find_item_index(items, item_id, lookups)
+        if pos is None or accept is None or accept(items[pos]):
+            return items, pos
+        for later in range(pos + 1, len(items)):
+            if items[later]["id"] == item_id and accept(items[later]):
+                return items, later
+        return items, None
+
+    def select(
+        self,
+        role: str,
+        from_filter: str | None = None,
+        in_reply_to_filter: str | None = None,
+        order: str = "fifo",
+        aging: int | None = None,
+    ) -> dict | None:
+        """Next eligible unclaimed item in the given dequeue order, or None."""
+        if order != "priority":
+            if not from_filter and not in_reply_to_filter:
+                return select_item(self.load(role))
+            # Filtered FIFO: visit only the positions the sender/reply lookups name
+            items, lookups = self.load_indexed(role)
+            for pos in filtered_positions(lookups, from_filter, in_reply_to_filter):
+                if item_matches(items[pos], from_filter, in_reply_to_filter):
+                    return items[pos]
+            return None
+        items, lookups = self.load_indexed(role)
+        heads = []
+        for positions in lookups["queues"].values():
+            for pos in positions:
+                if item_matches(items[pos], from_filter, in_reply_to_filter):
+                    heads.append((pos, items[pos]))
+                    break
+        return select_by_priority(heads, aging)
+
+    def watch_names(self, roles: list[str] | None) -> set[bytes] | None:
+        """Filenames in INBOX_DIR whose changes mean `roles` may have new items."""
+        return None
+
+    def watch_dirs(self, roles: list[str] | None) -> list[Path]:
+        """Directories InboxWatcher should watch for `roles` (all roles if None)."""
+        return [INBOX_DIR]
+
+
+class MarkdownStore(InboxStore):
+    """One human-readable {role}.md file per inbox, guarded by {role}.lock."""
+
+    name = "markdown"
+
+    @contextmanager
+    def lock(self, *roles: str):
+        # Sorted order: processes locking several inboxes can't deadlock
+        pending = [file_lock(get_inbox_path(role).with_suffix(".lock")) for role in sorted(set(roles))]
+        with ExitStack() as locks:
+            with traced("lock_wait"):  # Acquisition only; filelock's import happened above
+                for lock in pending:
+                    locks.enter_context(lock)
+            with traced("lock_hold"):
+                yield
+
+    def load(self, role: str) -> list[dict]:
+        return load_inbox(role)
+
+    def load_indexed(self, role: str) -> tuple[list[dict], dict]:
+        return load_inbox_indexed(role)
+
+    def save_lease(self, role: str, items: list[dict], item: dict) -> None:
+        if not patch_lease(role, item):
+            write_inbox(role, items)
+
+    def existing_ids(self, role: str, ids: set[str]) -> set[str]:
+        import mmap
+
+        inbox_path = get_inbox_path(role)
+        try:
+            st = inbox_path.stat()
+            # This process parsed the current version already: answer from its ID lookup
+            memo = _loaded.get(role)
+            if memo and memo[0] == stat_key(st):
+                return {item_id for item_id in ids if item_id in memo[2]["id"]}
+            if st.st_size == 0:
+                return set()
+            # Otherwise a byte search for the ID lines over a read-only mapping: no parse, no copy
+            with open(inbox_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return {item_id for item_id in ids if data.find(f"**ID:** {item_id}\n".encode()) != -1}
+        except FileNotFoundError:
+            return set()
+
+    def dedup_path(self, role: str) -> Path:
+        return get_dedup_path(role)
+
+    def dedup_get(self, role: str, keys: set[str]) -> dict[str, str]:
+        cutoff = dedup_cutoff()
+        known = read_dedup(self.dedup_path(role))
+        return {
+            key: known[key][0] for key in keys if key in known and known[key][1] >= cutoff
+        }
+
+    def dedup_put(self, role: str, keys: dict[str, str]) -> None:
+        import json
+        from datetime import datetime, timezone
+
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        cutoff = dedup_cutoff()
+        path = self.dedup_path(role)
+        known = {key: entry for key, entry in read_dedup(path).items() if entry[1] >= cutoff}
+        known.update({key: [item_id, now] for key, item_id in keys.items()})
+
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{role}.", suffix=".dedup.tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(known, f)
+            f.flush()
+            sync_file(f.fileno())
+        os.replace(temp_path, path)
+
+    def append(self, role: str, items: list[dict], sync_dir: bool = True) -> None:
+        append_inbox_items(role, items, sync_dir=sync_dir)
+
+    def save(self, role, items, changed=(), removed=()) -> None:
+        write_inbox(role, items)
+
+    def sync(self) -> None:
+        sync_directory()
+
+    def watch_names(self, roles: list[str] | None) -> set[bytes] | None:
+        return {f"{role}.md".encode() for role in roles} if roles else None
+
+
+class SqliteStore(InboxStore):
+    """
+    All inboxes in one SQLite database (agents/state/inboxes/inbox.db).
+
+    WAL mode lets readers run alongside the single writer; lock() is a
+    BEGIN IMMEDIATE transaction. Rows are indexed by role+status (plus
+    priority, for priority dequeue), role+id and in_reply_to. Use
+    `inbox.py export` for the markdown view.
+    """
+
+    name = "sqlite"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            from_agent TEXT NOT NULL,
+            date TEXT NOT NULL,
+            priority TEXT NOT NULL,
+            in_reply_to TEXT,
+            status TEXT,
+            claimed_at TEXT,
+            lease_until TEXT,
+            body TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS items_role_status ON items (role, status, seq);
+        CREATE INDEX IF NOT EXISTS items_role_priority ON items (role, status, priority, seq);
+        CREATE INDEX IF NOT EXISTS items_role_id ON items (role, id);
+        CREATE INDEX IF NOT EXISTS items_in_reply_to ON items (in_reply_to);
+        CREATE TABLE IF NOT EXISTS dedup (
+            role TEXT NOT NULL,
+            key TEXT NOT NULL,
+            id TEXT NOT NULL,
+            added_at TEXT NOT NULL,
+            PRIMARY KEY (role, key)
+        );
+    """
+    COLUMNS = (
+        "id, title, from_agent, date, priority, in_reply_to, status, claimed_at, lease_until, body"
+    )
+    # First row with a given ID, matching find_item_index on the markdown backend
+    FIRST_SEQ = "(SELECT MIN(seq) FROM items WHERE role = ? AND id = ?)"
+
+    def __init__(self, path: Path | None = None):
+        import threading
+
+        self.path = path or INBOX_DIR / "inbox.db"
+        self.local = threading.local()  # One connection per thread (broker)
+
+    def conn(self):
+        import sqlite3
+
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={'NORMAL' if DURABILITY == 'none' else 'FULL'}")
+            conn.executescript(self.SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(items)")}
+            if "lease_until" not in columns:  # Database created before claim leases
+                conn.execute("ALTER TABLE items ADD COLUMN lease_until TEXT")
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def lock(self, *roles: str):
+        conn = self.conn()
+        with traced("lock_wait"):
+            conn.execute("BEGIN IMMEDIATE")
+        with traced("lock_hold"):
+            try:
+                yield
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            with traced("write"):
+                conn.execute("COMMIT")
+
+    def find(self, role: str, item_id: str, accept=None) -> tuple[list[dict], int | None]:
+        with traced("read"):
+            rows = self.conn().execute(
+                f"SELECT seq, {self.COLUMNS} FROM items WHERE role = ? AND id = ? ORDER BY seq",
+                (role, item_id),
+            )
+            for scanned, row in enumerate(rows, 1):
+                item = self.row_item(row[1:])
+                if accept is None or accept(item):
+                    trace_count("items_scanned", scanned)
+                    self.local.found = (item, row[0])  # save() updates this row, not FIRST_SEQ
+                    return [item], 0
+        return [], None
+
+    def target(self, role: str, item: dict) -> tuple[str, tuple]:
+        """WHERE clause and parameters for the row `item` was loaded from."""
+        found = getattr(self.local, "found", None)
+        if found and found[0] is item:
+            return "seq = ?", (found[1],)
+        return f"seq = {self.FIRST_SEQ}", (role, item["id"])
+
+    def existing_ids(self, role: str, ids: set[str]) -> set[str]:
+        ids = list(ids)
+        rows = self.conn().execute(
+            f"SELECT id FROM items WHERE role = ? AND id IN ({', '.join('?' * len(ids))})",
+            [role, *ids],
+        )
+        return {row[0] for row in rows}
+
+    def dedup_get(self, role: str, keys: set[str]) -> dict[str, str]:
+        keys = list(keys)
+        rows = self.conn().execute(
+            f"SELECT key, id FROM dedup WHERE role = ? AND added_at >= ? "
+            f"AND key IN ({', '.join('?' * len(keys))})",
+            [role, dedup_cutoff(), *keys],
+        )
+        return dict(rows.fetchall())
+
+    def dedup_put(self, role: str, keys: dict[str, str]) -> None:
+        from datetime import datetime, timezone
+
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        conn = self.conn()
+        conn.execute("DELETE FROM dedup WHERE role = ? AND added_at < ?", (role, dedup_cutoff()))
+        conn.executemany(
+            "INSERT OR REPLACE INTO dedup (role, key, id, added_at) VALUES (?, ?, ?, ?)",
+            [(role, key, item_id, now) for key, item_id in keys.items()],
+        )
+
+    @staticmethod
+    def row_item(row) -> dict:
+        return {
+            "id": row[0],
+            "title": row[1],
+            "from": row[2],
+            "date": row[3],
+            "priority": row[4],
+            "in_reply_to": row[5],
+            "status": row[6],
+            "claimed_at": row[7],
+            "lease_until": row[8],
+            "body": row[9],
+        }
+
+    def load(self, role: str) -> list[dict]:
+        with traced("read"):
+            rows = self.conn().execute(
+                f"SELECT {self.COLUMNS} FROM items WHERE role = ? ORDER BY seq", (role,)
+            )
+            items = [self.row_item(row) for row in rows]
+        trace_count("items_scanned", len(items))
+        return items
+
+    def select(self, role, from_filter=None, in_reply_to_filter=None, order="fifo", aging=None):
+        from datetime import datetime, timezone
+
+        # Same semantics as InboxStore.select, answered from the indexes.
+        # Leases share one fixed-width UTC format, so they compare as text.
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        where = "role = ? AND (status IS NULL OR lease_until <= ?)"
+        params = [role, now]
+        if from_filter:
+            where += " AND (lower(from_agent) = ? OR substr(lower(from_agent), 1, ?) = ?)"
+            params += [from_filter, len(from_filter) + 1, f"{from_filter}:"]
+        if in_reply_to_filter:
+            if isinstance(in_reply_to_filter, str):
+                in_reply_to_filter = [in_reply_to_filter]
+            where += f" AND in_reply_to IN ({', '.join('?' * len(in_reply_to_filter))})"
+            params += in_reply_to_filter
+
+        conn = self.conn()
+        query = f"SELECT seq, {self.COLUMNS} FROM items WHERE {where} %s ORDER BY seq LIMIT 1"
+        if order != "priority":
+            row = conn.execute(query % "", params).fetchone()
+            return self.row_item(row[1:]) if row else None
+        heads = []
+        for priority in VALID_PRIORITIES:
+            if priority == VALID_PRIORITIES[-1]:  # Unknown priorities queue as LOW
+                clause = f"AND priority NOT IN ({', '.join('?' * (len(VALID_PRIORITIES) - 1))})"
+                extra = VALID_PRIORITIES[:-1]
+            else:
+                clause, extra = "AND priority = ?", [priority]
+            row = conn.execute(query % clause, params + extra).fetchone()
+            if row:
+                heads.append((row[0], self.row_item(row[1:])))
+        return select_by_priority(heads, aging)
+
+    def append(self, role: str, items: list[dict], sync_dir: bool = True) -> None:
+        with traced("write"):
+            self.conn().executemany(
+                f"INSERT INTO items (role, {self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        role,
+                        item["id"],
+                        item["title"],
+                        item["from"],
+                        item["date"],
+                        item["priority"],
+                        item.get("in_reply_to"),
+                        item.get("status"),
+                        item.get("claimed_at"),
+                        item.get("lease_until"),
+                        # Same normalization the markdown round trip applies
+                        item_body(item).strip(),
+                    )
+                    for item in items
+                ],
+            )
+
+    def save(self, role, items, changed=(), removed=()) -> None:
+        conn = self.conn()
+        for item in removed:
+            where, params = self.target(role, item)
+            conn.execute(f"DELETE FROM items WHERE {where}", params)
+        for item in changed:
+            where, params = self.target(role, item)
+            conn.execute(
+                f"UPDATE items SET title = ?, from_agent = ?, date = ?, priority = ?, "
+                f"in_reply_to = ?, status = ?, claimed_at = ?, lease_until = ?, body = ? "
+                f"WHERE {where}",
+                (
+                    item["title"],
+                    item["from"],
+                    item["date"],
+                    item["priority"],
+                    item.get("in_reply_to"),
+                    item.get("status"),
+                    item.get("claimed_at"),
+                    item.get("lease_until"),
+                    item_body(item),
+                    *params,
+                ),
+            )
+
+    def watch_names(self, roles: list[str] | None) -> set[bytes] | None:
+        # Commits land in the WAL file; checkpoints rewrite the main file
+        return {self.path.name.encode(), f"{self.path.name}-wal".encode()}
+
+
+class MaildirStore(InboxStore):
+    """
+    One file per message under agents/state/inboxes/{role}/, Maildir-style.
+
+    A message is written in tmp/ and renamed into new/ (unclaimed) or cur/
+    (claimed). Its name (arrival stamp, PID, ID) never changes, so sorting
+    new/ and cur/ together gives FIFO order. There is no inbox-wide lock:
+    producers only rename into new/, and save() changes a message by first
+    renaming it into tmp/ as "held" and checking it is still the version
+    that was loaded. Two writers racing for the same message get
+    InboxConflict for the loser; writers on different messages never wait.
+    `read` and `export` render the usual combined markdown view.
+    """
+
+    name = "maildir"
+
+    def __init__(self):
+        import threading
+
+        self.local = threading.local()  # Per-thread load snapshots and pending syncs
+        # role -> {(folder, name, inode, mtime, size): (item, text)}: unchanged files aren't re-read
+        self.parsed: dict[str, dict[tuple, tuple[dict, str]]] = {}
+        self.stamp_lock = threading.Lock()
+        self.last_stamp = 0
+        self.ready: set[str] = set()
+
+    def role_dir(self, role: str) -> Path:
+        return INBOX_DIR / role
+
+    def snapshots(self) -> dict[str, dict[str, tuple[str, str, str]]]:
+        """role -> {item ID: (name, folder, text)} as last loaded by this thread."""
+        if not hasattr(self.local, "seen"):
+            self.local.seen = {}
+        return self.local.seen
+
+    @contextmanager
+    def lock(self, *roles: str):
+        # Nothing to take: every save() is a compare-and-swap on one message
+        yield
+
+    def names(self, role: str) -> list[tuple[str, str]]:
+        """(name, folder) of every delivered message for a role, oldest first."""
+        root = self.role_dir(role)
+        found = []
+        for folder in ("new", "cur"):
+            try:
+                found.extend(
+                    (name, folder) for name in os.listdir(root / folder) if name.endswith(".md")
+                )
+            except FileNotFoundError:
+                pass
+        found.sort()
+        return found
+
+    def recover(self, role: str) -> None:
+        """Put back messages held by writers that died mid-change."""
+        tmp = self.role_dir(role) / "tmp"
+        try:
+            held = [name for name in os.listdir(tmp) if name.endswith(".held")]
+        except FileNotFoundError:
+            return
+        for name in held:
+            # {message}.{folder}.{pid}.{thread}.held
+            message, folder, pid, _thread, _ = name.rsplit(".", 4)
+            try:
+                os.kill(int(pid), 0)
+                continue  # Writer still running
+            except ProcessLookupError:
+                pass
+            except (PermissionError, ValueError):
+                continue
+            try:
+                os.rename(tmp / name, self.role_dir(role) / folder / message)
+            except OSError:
+                pass  # Another reader recovered it first
+
+    def load(self, role: str) -> list[dict]:
+        self.recover(role)
+        root = self.role_dir(role)
+        entries = []
+        for folder in ("new", "cur"):
+            try:
+                with os.scandir(root / folder) as listing:
+                    entries.extend((e.name, folder, e) for e in listing if e.name.endswith(".md"))
+            except FileNotFoundError:
+                pass
+        entries.sort(key=lambda entry: entry[0])
+
+        # Messages only ever change by rename, so a stat identifies the content
+        cache = self.parsed.get(role, {})
+        fresh = {}
+        items, messages, seen = [], [], {}
+        with traced("read"):
+            for name, folder, entry in entries:
+                try:
+                    st = entry.stat()
+                    key = (folder, name, st.st_ino, st.st_mtime_ns, st.st_size)
+                    cached = cache.get(key)
+                    if cached is None:
+                        text = (root / folder / name).read_text()
+                        parsed = parse_block(text)
+                        if not parsed:
+                            continue
+                        cached = (parsed, text)
+                except FileNotFoundError:
+                    continue  # Moved by a concurrent writer since the listing
+                fresh[key] = cached
+                items.append(dict(cached[0]))
+                messages.append((name, folder, cached[1]))
+                seen.setdefault(cached[0]["id"], messages[-1])  # First copy, like find_item_index
+        trace_count("items_scanned", len(items))
+        self.parsed[role] = fresh
+        self.snapshots()[role] = seen
+        self.local.messages = messages
+        return items
+
+    def find(self, role: str, item_id: str, accept=None) -> tuple[list[dict], int | None]:
+        items, pos = super().find(role, item_id, accept)
+        if pos is not None:
+            # save() swaps the message this copy came from
+            self.snapshots()[role][item_id] = self.local.messages[pos]
+        return items, pos
+
+    def existing_ids(self, role: str, ids: set[str]) -> set[str]:
+        # IDs are part of the filenames: a directory listing, no reads
+        return ids & {name.rsplit(".", 2)[1] for name, _ in self.names(role)}
+
+    dedup_get = MarkdownStore.dedup_get
+
+    dedup_put = MarkdownStore.dedup_put
+
+    def dedup_path(self, role: str) -> Path:
+        # Inside the role directory: keys recorded by the markdown backend don't apply here
+        return self.prepare(role) / "dedup.json"
+
+    def dedup_lock(self, role: str):
+        # lock() takes nothing, so keyed adds serialize on the dedup file's own lock
+        return file_lock(self.prepare(role) / "dedup.lock")
+
+    def prepare(self, role: str) -> Path:
+        root = self.role_dir(role)
+        if role not in self.ready:
+            for folder in ("tmp", "new", "cur"):
+                (root / folder).mkdir(parents=True, exist_ok=True)
+            self.ready.add(role)
+        return root
+
+    def next_name(self, item: dict) -> str:
+        import time
+
+        # Strictly increasing within the process, so a batch keeps its order
+        with self.stamp_lock:
+            self.last_stamp = max(self.last_stamp + 1, time.time_ns())
+            stamp = self.last_stamp
+        return f"{stamp:020d}.{os.getpid()}.{item['id']}.md"
+
+    @staticmethod
+    def write_message(path: Path, item: dict) -> str:
+        with traced("format"):
+            text = format_item(spill_body(item)) + "\n"
+        with traced("write"), open(path, "w") as f:
+            f.write(text)
+            f.flush()
+            sync_file(f.fileno())
+        return text
+
+    def finish(self, directory: Path, sync_dir: bool) -> None:
+        if sync_dir:
+            sync_directory(directory)
+        else:
+            self.local.pending = getattr(self.local, "pending", set()) | {directory}
+
+    def append(self, role: str, items: list[dict], sync_dir: bool = True) -> None:
+        import threading
+
+        root = self.prepare(role)
+        for item in items:
+            name = self.next_name(item)
+            staged = root / "tmp" / f"{name}.{threading.get_ident()}.tmp"
+            self.write_message(staged, item)
+            os.rename(staged, root / ("cur" if item.get("status") else "new") / name)
+        self.finish(root / "new", sync_dir)
+
+    def replace(self, role: str, item: dict, new_item: dict | None) -> None:
+        """Swap one message for `new_item` (None deletes) if unchanged since load."""
+        import threading
+
+        seen = self.snapshots().get(role, {})
+        if item["id"] not in seen:
+            raise InboxConflict(f"Item '{item['id']}' was not loaded; reload and retry.")
+        name, folder, text = seen[item["id"]]
+        root = self.prepare(role)
+        suffix = f"{os.getpid()}.{threading.get_ident()}"
+        staged = root / "tmp" / f"{name}.{suffix}.tmp"
+        if new_item is not None:
+            new_text = self.write_message(staged, new_item)
+        held = root / "tmp" / f"{name}.{folder}.{suffix}.held"
+        try:
+            os.rename(root / folder / name, held)
+        except FileNotFoundError:
+            staged.unlink(missing_ok=True)
+            raise InboxConflict(f"Item '{item['id']}' was changed by another agent.") from None
+        if held.read_text() != text:
+            os.rename(held, root / folder / name)
+            staged.unlink(missing_ok=True)
+            raise InboxConflict(f"Item '{item['id']}' was changed by another agent.")
+        if new_item is None:
+            del seen[item["id"]]
+        else:
+            target = "cur" if new_item.get("status") else "new"
+            os.rename(staged, root / target / name)
+            seen[item["id"]] = (name, target, new_text)
+            if target != folder:
+                self.finish(root / target, True)
+        held.unlink()
+
+    def save(self, role, items, changed=(), removed=()) -> None:
+        for item in removed:
+            self.replace(role, item, None)
+        for item in changed:
+            self.replace(role, item, item)
+
+    def sync(self) -> None:
+        for directory in getattr(self.local, "pending", ()):
+            sync_directory(directory)
+        self.local.pending = set()
+
+    def watch_dirs(self, roles: list[str] | None) -> list[Path]:
+        # Deliveries land in new/, claims in cur/; tmp/ churn is ignored
+        return [self.prepare(role) / folder for role in roles or VALID_ROLES for folder in ("new", "cur")]
+
+
+_stores: dict[str, InboxStore] = {}
+
+
+def get_store() -> InboxStore:
+    """The storage backend selected by BACKEND (one instance per process)."""
+    if BACKEND not in _stores:
+        _stores[BACKEND] = {
+            "markdown": MarkdownStore,
+            "sqlite": SqliteStore,
+            "maildir": MaildirStore,
+        }[BACKEND]()
+    return _stores[BACKEND]
+
+
+class InboxWatcher:
+    """
+    Block until an inbox file changes, or a timeout passes.
+
+    On Linux this is a stdlib-only inotify watch (via ctypes) on the inbox
+    directories the store names (watch_dirs), so idle waiters sleep in the kernel and wake within
+    milliseconds of a write. Anywhere inotify is unavailable it degrades to
+    sleeping POLL_INTERVAL seconds. Callers always re-check the inbox after
+    wait() returns; a wake-up is a hint, never a guarantee of a new item.
+
+    Create the watcher before the first check so no change is missed.
+    """
+
+    # inotify(7) constants
+    _IN_MODIFY = 0x00000002
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+    _IN_NONBLOCK = 0o4000
+    _IN_CLOEXEC = 0o2000000
+
+    def __init__(self, roles: list[str] | None = None):
+        self.fd = None
+        # Files to wake for; None means any markdown file in the directories
+        self.names = get_store().watch_names(roles)
+        directories = get_store().watch_dirs(roles)
+        for directory in directories:
+            directory.mkdir(parents=True, exist_ok=True)
+        if sys.platform != "linux":
+            return
+        try:
+            import ctypes
+
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(self._IN_NONBLOCK | self._IN_CLOEXEC)
+            if fd < 0:
+                return
+            mask = self._IN_MODIFY | self._IN_CLOSE_WRITE | self._IN_MOVED_TO | self._IN_CREATE
+            for directory in directories:
+                if libc.inotify_add_watch(fd, str(directory).encode(), mask) < 0:
+                    os.close(fd)
+                    return
+            self.fd = fd
+        except (OSError, AttributeError):
+            self.fd = None  # No inotify symbols (non-glibc, sandbox): poll instead
+
+    def __enter__(self) -> "InboxWatcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def wait(self, timeout: float) -> None:
+        """Return once a watched inbox changes or `timeout` seconds pass."""
+        with traced("idle"):
+            self._wait(timeout)
+
+    def _wait(self, timeout: float) -> None:
+        import time
+
+        if self.fd is None:
+            time.sleep(max(0, min(POLL_INTERVAL, timeout)))
+            return
+
+        import select
+
+        deadline = time.monotonic() + min(timeout, WATCH_RECHECK)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if readable and self._drain():
+                return
+
+    def _drain(self) -> bool:
+        """Consume queued events; True if any touched a watched inbox file."""
+        import struct
+
+        changed = False
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            pos = 0
+            while pos + 16 <= len(buf):
+                _wd, _mask, _cookie, name_len = struct.unpack_from("iIII", buf, pos)
+                name = buf[pos + 16 : pos + 16 + name_len].rstrip(b"\0")
+                # Lock, index and temp files churn on every operation; ignore them
+                if name in self.names if self.names else name.endswith(b".md"):
+                    changed = True
+                pos += 16 + name_len
+
+
+class InboxError(Exception):
+    """An inbox operation was refused; str(exc) is the user-facing message."""
+
+
+class InboxConflict(InboxError):
+    """Another agent changed the item between load and save (maildir backend)."""
+
+
+def lease_deadline(lease: int | None = None) -> str | None:
+    """Expiry timestamp for a claim made now (`lease` seconds, default LEASE_SECONDS)."""
+    from datetime import datetime, timedelta, timezone
+
+    lease = LEASE_SECONDS if lease is None else lease
+    if lease <= 0:
+        return None
+    # Fixed width (second precision, +00:00), so renew can patch it in place
+    return (datetime.now(timezone.utc) + timedelta(seconds=lease)).isoformat(timespec="seconds")
+
+
+def lease_expired(item: dict, now=None) -> bool:
+    """True if the item is claimed under a lease that has run out."""
+    from datetime import datetime, timezone
+
+    if not item.get("status") or not item.get("lease_until"):
+        return False
+    try:
+        return datetime.fromisoformat(item["lease_until"]) <= (now or datetime.now(timezone.utc))
+    except (ValueError, TypeError):
+        return False  # Unreadable lease: treat the claim as held
+
+
+def item_matches(
+    item: dict, from_filter: str | None = None, in_reply_to_filter: str | None = None
+) -> bool:
+    """True if the item is unclaimed (or its lease expired) and passes the optional filters."""
+    if item.get("status") and not lease_expired(item):  # Skip claimed
+        return False
+
+    # Apply sender filter if provided (handles "role:name" format)
+    if from_filter:
+        item_sender = item.get("from", "").lower().split(":")[0]
+        if item_sender != from_filter:
+            return False
+
+    # Apply in_reply_to filter if provided (exact match, or any of several IDs)
+    if in_reply_to_filter:
+        if isinstance(in_reply_to_filter, str):
+            in_reply_to_filter = [in_reply_to_filter]
+        if item.get("in_reply_to") not in in_reply_to_filter:
+            return False
+
+    return True
+
+
+def select_item(
+    items: list[dict], from_filter: str | None = None, in_reply_to_filter: str | None = None
+) -> dict | None:
+    """Return the first unclaimed item (document order) matching the optional filters."""
+    for item in items:
+        if item_matches(item, from_filter, in_reply_to_filter):
+            return item
+    return None
+
+
+def effective_rank(item: dict, aging: int | None = None, today: date | None = None) -> int:
+    """
+    Priority rank of an item (0 = HIGH), after aging.
+
+    With `aging`, an item moves up one level for every `aging` days since its
+    date, so old LOW items are not starved by a steady stream of HIGH ones.
+    """
+    priority = item.get("priority")
+    rank = VALID_PRIORITIES.index(priority) if priority in VALID_PRIORITIES else len(VALID_PRIORITIES) - 1
+    if aging:
+        try:
+            rank -= ((today or date.today()) - date.fromisoformat(item["date"])).days // aging
+        except (ValueError, TypeError, KeyError):
+            pass  # Undated items don't age
+    return max(rank, 0)
+
+
+def select_by_priority(heads: list[tuple[int, dict]], aging: int | None = None) -> dict | None:
+    """
+    Pick among priority queue heads, given as (position, item) pairs.
+
+    Lowest effective rank wins; ties go to the oldest (lowest position), so
+    order is FIFO within a priority. Each queue is in arrival order, so its
+    first eligible item is also its most aged one.
+    """
+    today = date.today()
+    best = min(heads, key=lambda head: (effective_rank(head[1], aging, today), head[0]), default=None)
+    return best[1] if best else None
+
+
+def item_to_json(item: dict) -> dict:
+    """Agent-facing JSON view of an item (status fields omitted)."""
+    output = {
+        "id": item["id"],
+        "title": item["title"],
+        "from": item["from"],
+        "date": item["date"],
+        "priority": item["priority"],
+        "body": item_body(item),
+    }
+    if item.get("in_reply_to"):
+        output["in_reply_to"] = item["in_reply_to"]
+    return output
+
+
+def peek_item(
+    role: str,
+    from_filter: str | None = None,
+    in_reply_to_filter: str | None = None,
+    order: str | None = None,
+    aging: int | None = None,
+) -> dict:
+    """JSON for the next eligible unclaimed item (see InboxStore.select), or {}."""
+    item = get_store().select(role, from_filter, in_reply_to_filter, order or DEQUEUE_ORDER, aging)
+    return item_to_json(item) if item else {}
+
+
+def filtered_positions(
+    lookups: dict, from_filter: str | None, in_reply_to_filter: str | list[str] | None
+) -> list[int]:
+    """Positions (ascending) that can match the filters, from build_lookups."""
+    if in_reply_to_filter:
+        if isinstance(in_reply_to_filter, str):
+            in_reply_to_filter = [in_reply_to_filter]
+        return sorted(
+            {pos for parent in in_reply_to_filter for pos in lookups["in_reply_to"].get(parent, [])}
+        )
+    return lookups["from"].get(from_filter, [])
+
+
+def find_item_index(items: list[dict], item_id: str, lookups: dict | None = None) -> int | None:
+    """Position of the first item with `item_id` (via the id lookup when given), or None."""
+    if lookups is not None:
+        return lookups["id"].get(item_id)
+    for idx, item in enumerate(items):
+        if item["id"] == item_id:
+            return idx
+    return None
+
+
+def missing_item(store: "InboxStore", role: str, item_id: str) -> InboxError:
+    """The error for an item ID that store.find() didn't locate."""
+    if not store.load(role):
+        return InboxError(f"{role.capitalize()} inbox is empty.")
+    return InboxError(f"No item found with ID '{item_id}'.")
+
+
+def find_held(store: "InboxStore", role: str, item_id: str, token: str) -> tuple[list[dict], int | None]:
+    """store.find for the copy claimed with `token`, else the first copy (whose checks then fail)."""
+    items, found_idx = store.find(role, item_id, lambda item: item.get("status") == token)
+    if found_idx is None:
+        items, found_idx = store.find(role, item_id)
+    return items, found_idx
+
+
+def add_item(
+    role: str, title: str, from_agent: str, priority: str, body: str, key: str | None = None
+) -> dict:
+    """Append a new item to a role's inbox and return it (see add_items for `key`)."""
+    spec = {"title": title, "from": from_agent, "priority": priority, "body": body, "key": key}
+    return add_items(role, [spec])[0]
+
+
+def assign_item_ids(store: "InboxStore", role: str, items: list[dict]) -> None:
+    """
+    Give new items salted IDs unused in the role's inbox and in the batch.
+
+    The check sees IDs already delivered. Where lock() is exclusive
+    (markdown, sqlite) the caller holds it, so no concurrent writer can take
+    an ID between the check and the append; maildir has no such lock and
+    relies on the random salt to keep racing adders apart.
+    """
+    used: set[str] = set()
+    pending = items
+    while pending:
+        for item in pending:
+            salt = os.urandom(8).hex()
+            item["id"] = generate_item_id(item["title"], item["from"], item["date"], item["priority"], salt)
+        clashes = store.existing_ids(role, {item["id"] for item in pending})
+        retry = []
+        for item in pending:
+            if item["id"] in clashes or item["id"] in used:
+                retry.append(item)
+            else:
+                used.add(item["id"])
+        pending = retry
+
+
+def add_items(role: str, specs: list[dict], sync_dir: bool = True) -> list[dict]:
+    """
+    Append several items to one inbox under a single lock and a single write.
+
+    Each spec needs title, from, priority and body (already validated), and
+    may carry an idempotency "key". A key already recorded within
+    DEDUP_WINDOW_DAYS (or earlier in the same batch) is not enqueued again:
+    its result is the original item's ID with "duplicate": True.
+    Returns the stored items, in order, with their generated IDs.
+    """
+    date_str = str(date.today())
+    items = [
+        {
+            "id": None,  # Assigned under the lock
+            "title": spec["title"],
+            "from": spec["from"],
+            "date": date_str,
+            "priority": spec["priority"],
+            "body": spec["body"],
+        }
+        for spec in specs
+    ]
+
+    store = get_store()
+    keys = {spec["key"] for spec in specs if spec.get("key")}
+    # The dedup lock covers check, append and record, so racing adds of one key enqueue once
+    with store.lock(role), store.dedup_lock(role) if keys else nullcontext():
+        known = store.dedup_get(role, keys) if keys else {}
+        if known:
+            # A key only counts if its item really reached this store
+            live = delivered_ids(store, role, set(known.values()))
+            known = {key: item_id for key, item_id in known.items() if item_id in live}
+        fresh, firsts, repeats = [], {}, []
+        for position, (spec, item) in enumerate(zip(specs, items)):
+            key = spec.get("key")
+            if key and (key in known or key in firsts):
+                repeats.append((position, key))
+                continue
+            fresh.append(item)
+            if key:
+                firsts[key] = item
+
+        if fresh:
+            assign_item_ids(store, role, fresh)
+            # Append-only: existing items are neither parsed nor rewritten
+            store.append(role, fresh, sync_dir=sync_dir)
+        if firsts:
+            # After the append: a crash in between can only cause a duplicate, never a loss
+            store.dedup_put(role, {key: item["id"] for key, item in firsts.items()})
+
+    for position, key in repeats:
+        item_id = known[key] if key in known else firsts[key]["id"]
+        items[position] = {**items[position], "id": item_id, "duplicate": True}
+    return items
+
+
+def parse_batch_line(line: str) -> dict:
+    """
+    Validate one add-batch JSONL record and normalize it into an add spec.
+
+    Required: role, title, from. Optional: priority (default MEDIUM), body,
+    key (idempotency key, see add_items).
+    """
+    import json
+
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        raise InboxError(f"Invalid JSON: {e}")
+    if not isinstance(record, dict):
+        raise InboxError("Each line must be a JSON object.")
+    return validate_batch_spec(record)
+
+
+def validate_batch_spec(record: dict) -> dict:
+    """
+    Check one batch record's fields and normalize it into an add spec.
+
+    The broker calls this again on every item it receives: specs arrive over
+    the socket from any client, and role ends up in a file path.
+    """
+    role = str(record.get("role", "")).lower()
+    if role not in VALID_ROLES:
+        raise InboxError(f"Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}")
+    for field in ("title", "from"):
+        if not record.get(field):
+            raise InboxError(f"'{field}' is required.")
+    priority = str(record.get("priority", "MEDIUM")).upper()
+    if priority not in VALID_PRIORITIES:
+        raise InboxError(f"Invalid priority '{priority}'. Use: {', '.join(VALID_PRIORITIES)}")
+
+    return {
+        "role": role,
+        "title": str(record["title"]),
+        "from": str(record["from"]),
+        "priority": priority,
+        "body": str(record.get("body") or "").strip(),
+        "key": str(record["key"]) if record.get("key") else None,
+    }
+
+
+def add_batch(specs: list[dict]) -> list[dict]:
+    """
+    Enqueue validated batch specs, grouped so each inbox is locked and written once.
+
+    Group commit: each inbox gets one write (and one fsync, if enabled) and
+    the directory is synced once at the end rather than once per inbox.
+
+    Returns one {"role", "id", "title"} result per spec, in input order,
+    plus "duplicate": True where an idempotency key matched.
+    """
+    by_role: dict[str, list[int]] = {}
+    for position, spec in enumerate(specs):
+        by_role.setdefault(spec["role"], []).append(position)
+
+    results: list[dict] = [{}] * len(specs)
+    for role, positions in by_role.items():
+        items = add_items(role, [specs[p] for p in positions], sync_dir=False)
+        for position, item in zip(positions, items):
+            results[position] = {"role": role, "id": item["id"], "title": item["title"]}
+            if item.get("duplicate"):
+                results[position]["duplicate"] = True
+    if by_role:
+        get_store().sync()
+    return results
+
+
+def claim_item(
+    role: str, item_id: str, session_id: str | None = None, lease: int | None = None
+) -> dict:
+    """
+    Mark an item as claimed by `session_id` (generated if omitted) and return it.
+
+    The claim holds for `lease` seconds unless renewed, or indefinitely if
+    `lease` is None (an interactive claim shouldn't lapse unnoticed; take
+    applies LEASE_SECONDS). An item whose lease has expired can be claimed
+    again.
+    """
+    from datetime import datetime, timezone
+
+    session_id = session_id or get_next_session_id(role)
+    store = get_store()
+
+    # Atomic read-modify-write under the inbox lock
+    with store.lock(role):
+        items, found_idx = store.find(role, item_id, item_matches)  # An unclaimed copy first
+        if found_idx is None:
+            items, found_idx = store.find(role, item_id)
+        if found_idx is None:
+            raise missing_item(store, role, item_id)
+
+        item = items[found_idx]
+
+        # Check if already claimed (expired leases are fair game)
+        if item.get("status") and not lease_expired(item):
+            raise InboxError(f"Item already claimed by session: {item['status']}")
+
+        # Update item with claimed status, timestamp and lease
+        item["status"] = session_id
+        item["claimed_at"] = datetime.now(timezone.utc).isoformat()
+        item["lease_until"] = lease_deadline(lease) if lease is not None else None
+
+        store.save(role, items, changed=[item])
+
+    return item
+
+
+def take_item(
+    role: str,
+    from_filter: str | None = None,
+    in_reply_to_filter: str | None = None,
+    order: str | None = None,
+    aging: int | None = None,
+    session_id: str | None = None,
+    lease: int | None = None,
+) -> dict:
+    """
+    Select and claim the next eligible item under a single lock.
+
+    Selection matches peek_item, so an item whose claim lease expired is
+    reclaimed here. Returns the item's JSON plus "token" (the session ID for
+    respond/unclaim/renew) and "lease_until", or {} if nothing is eligible.
+    Unlike peek followed by claim, concurrent takers never get the same item;
+    on the lock-free maildir backend a taker that loses a race moves on to
+    the next eligible item.
+    """
+    from datetime import datetime, timezone
+
+    store = get_store()
+    session_id = session_id or get_next_session_id(role)
+    missed: set[str] = set()  # IDs that were selected but couldn't be claimed
+    while True:
+        with store.lock(role):
+            selected = store.select(
+                role, from_filter, in_reply_to_filter, order or DEQUEUE_ORDER, aging
+            )
+            if not selected or selected["id"] in missed:
+                return {}  # Empty, or no progress since the last attempt
+            # The first eligible copy: IDs from before salting can repeat
+            items, found_idx = store.find(
+                role, selected["id"], lambda item: item_matches(item, from_filter, in_reply_to_filter)
+            )
+            if found_idx is None:
+                missed.add(selected["id"])
+                continue  # Removed or claimed since select (maildir)
+            item = items[found_idx]
+            item["status"] = session_id
+            item["claimed_at"] = datetime.now(timezone.utc).isoformat()
+            item["lease_until"] = lease_deadline(lease)
+            try:
+                store.save(role, items, changed=[item])
+            except InboxConflict:
+                missed.add(selected["id"])
+                continue
+        break
+
+    return {**item_to_json(item), "token": session_id, "lease_until": item["lease_until"]}
+
+
+def renew_item(role: str, item_id: str, token: str, lease: int | None = None) -> dict:
+    """
+    Extend the lease on an item claimed with `token` (heartbeat) and return it.
+
+    Fails if the lease already expired and someone else took the item. On
+    the markdown backend the timestamp is patched in place, not rewritten.
+    """
+    store = get_store()
+    with store.lock(role):
+        items, found_idx = find_held(store, role, item_id, token)
+        if found_idx is None:
+            raise InboxError(f"No item found with ID '{item_id}'.")
+        item = items[found_idx]
+        if not item.get("status"):
+            raise InboxError("Item is not claimed.")
+        if item["status"] != token:
+            raise InboxError(f"Cannot renew: item claimed by {item['status']}, not {token}.")
+        item["lease_until"] = lease_deadline(lease)
+        store.save_lease(role, items, item)
+    return item
+
+
+def unclaim_item(role: str, item_id: str, token: str) -> dict | None:
+    """
+    Release a claim made with `token`; return the item, or None if it wasn't claimed.
+    """
+    store = get_store()
+    # Atomic read-modify-write under the inbox lock
+    with store.lock(role):
+        items, found_idx = find_held(store, role, item_id, token)
+        if found_idx is None:
+            raise missing_item(store, role, item_id)
+        item = items[found_idx]
+        if not item.get("status"):
+            return None
+        if item["status"] != token:
+            raise InboxError(
+                f"Cannot unclaim: token mismatch.\n"
+                f"Item claimed by: {item['status']}\n"
+                f"Your token: {token}"
+            )
+        # Remove claim, timestamp and lease
+        item["status"] = None
+        item["claimed_at"] = None
+        item["lease_until"] = None
+        store.save(role, items, changed=[item])
+    return item
+
+
+def delete_item(role: str, item_id: str) -> dict:
+    """Remove an item by ID (moving it to the archive) and return it."""
+    store = get_store()
+    with store.lock(role):
+        items, found_idx = store.find(role, item_id)
+        if found_idx is None:
+            raise missing_item(store, role, item_id)
+        deleted = items.pop(found_idx)
+        archive_items(role, [deleted], "deleted")
+        store.save(role, items, removed=[deleted])
+    return deleted
+
+
+def respond_item(role: str, item_id: str, token: str, body: str) -> tuple[str, dict]:
+    """
+    Respond to a claimed item in one critical section.
+
+    1. Look up the item's sender (lockless) to know which inboxes are involved
+    2. Lock our inbox and the sender's together (the markdown backend takes
+       file locks in sorted role order, so concurrent responders can't deadlock)
+    3. Verify the token, deliver the response, delete the original
+
+    Our inbox is loaded once and saved once; the sender's is only appended
+    to. Delivery happens before deletion, so a crash in between leaves the
+    original still claimed beside its response (a duplicate at worst), never
+    a lost message. The original is moved to the archive.
+
+    Returns (sender_role, response_item).
+    """
+    def verified(items: list[dict], found_idx: int | None) -> tuple[int, dict, str]:
+        if found_idx is None:
+            raise missing_item(store, role, item_id)
+
+        item = items[found_idx]
+
+        # Verify item is claimed
+        if not item.get("status"):
+            raise InboxError("Item is not claimed. Cannot respond to unclaimed item.")
+
+        # Verify token matches
+        if item["status"] != token:
+            raise InboxError(
+                f"Cannot respond: token mismatch.\n"
+                f"Item claimed by: {item['status']}\n"
+                f"Your token: {token}"
+            )
+
+        # Determine sender (where to send response)
+        # Handle "role:name" format (e.g., "engineer:swift-falcon" → "engineer")
+        sender_role = item.get("from", "").lower().split(":")[0]
+        if sender_role not in VALID_ROLES:
+            raise InboxError(f"Invalid sender role '{sender_role}' in item. Cannot send response.")
+        return found_idx, item, sender_role
+
+    store = get_store()
+
+    # Lockless pre-check: fail fast and learn which second lock we need
+    _, _, sender_role = verified(*find_held(store, role, item_id, token))
+
+    with store.lock(role, sender_role):
+        items, found_idx = find_held(store, role, item_id, token)
+        found_idx, item, locked_sender = verified(items, found_idx)
+        if locked_sender != sender_role:
+            raise InboxError("Item changed during respond operation.")
+
+        # Prepare response
+        response_title = f"Re: {item['title']}"
+        response_item = {
+            "id": None,  # Assigned below, unique in the sender's inbox
+            "title": response_title,
+            "from": role,
+            "date": str(date.today()),
+            "priority": item["priority"],
+            "body": body,
+            "in_reply_to": item_id,  # Thread correlation - lets sender wait for this specific response
+        }
+        assign_item_ids(store, sender_role, [response_item])
+
+        items.pop(found_idx)
+        archive_items(role, [item], "responded", response_id=response_item["id"])
+        # Deliver first, then delete (see docstring); one directory sync for both
+        store.append(sender_role, [response_item], sync_dir=False)
+        if sender_role == role:
+            items.append(response_item)  # Keep the full list in step with the append
+        store.save(role, items, removed=[item])
+
+    return sender_role, response_item
 
-    today = date.today().isoformat()
-    pid = os.getpid()
-    timestamp = int(time.time() * 1000) % 100000  # Last 5 digits ms
 
-    return f"{role}-{today}-{pid}-{timestamp}"
+def get_broker_path() -> Path:
+    """Unix socket the optional broker listens on."""
+    return INBOX_DIR / "broker.sock"
 
 
-def parse_inbox(content: str) -> list[dict]:
+def broker_request(request: dict, timeout: float | None = None) -> dict | None:
     """
-    Parse inbox markdown into structured items.
+    Send one request to a running broker and return its result.
 
-    Auto-generates IDs for items that don't have them (migration).
+    Returns None when no broker is listening, so callers fall back to
+    direct file mode. Once connected, failures raise InboxError rather than
+    falling back: the broker may already have applied the operation.
+    Set INBOX_BROKER=off to force direct mode.
     """
-    items = []
+    import json
+    import socket
 
-    # Split on --- separators
-    parts = re.split(r"\n---\n", content)
+    broker_path = get_broker_path()
+    if os.environ.get("INBOX_BROKER") == "off" or not broker_path.exists():
+        return None
 
-    for part in parts:
-        part = part.strip()
-        if not part:
-            continue
-        # Remove header line if present, keep rest of block
-        if part.startswith("# "):
-            lines = part.split("\n", 1)
-            if len(lines) > 1:
-                part = lines[1].strip()
-            else:
-                continue  # Only header, no content
-        if not part:
-            continue
-        # Skip HTML comments (legacy template format)
-        if part.startswith("<!--") and part.endswith("-->"):
-            continue
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(str(broker_path))
+        except OSError:
+            return None  # Stale socket file: no broker running
+        sock.settimeout(timeout)
+        # Tag with our backend so a broker serving another store refuses the request
+        request = {**request, "backend": BACKEND}
+        with traced("broker"):
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as reply_file:
+                line = reply_file.readline()
+    except OSError as e:
+        raise InboxError(f"Broker connection failed: {e}")
+    finally:
+        sock.close()
+
+    if not line:
+        raise InboxError("Broker closed the connection without replying.")
+    reply = json.loads(line)
+    if not reply.get("ok"):
+        raise InboxError(reply.get("error", "Broker request failed."))
+    return reply["result"]
+
+
+class InboxBroker:
+    """
+    In-process inbox server behind `inbox.py serve`.
+
+    Holds parsed inboxes in memory (load_inbox's per-process memo, validated
+    by one stat per request), serializes every mutation through a single
+    mutex, and persists through the same locked store as direct mode, so
+    brokered and direct clients can run side by side. Waiters block
+    on a condition that is bumped by the broker's own writes and by an
+    inotify watcher thread for writes made by direct-mode clients.
+    """
 
-        # Extract title (## line)
-        title_match = re.search(r"^## (.+)$", part, re.MULTILINE)
-        title = title_match.group(1) if title_match else "Untitled"
-
-        # Extract metadata
-        id_match = re.search(r"\*\*ID:\*\*\s*([a-f0-9]{7})(?:\n|$)", part)
-        from_match = re.search(r"\*\*From:\*\*\s*(.+?)(?:\n|$)", part)
-        date_match = re.search(r"\*\*Date:\*\*\s*(.+?)(?:\n|$)", part)
-        priority_match = re.search(r"\*\*Priority:\*\*\s*(.+?)(?:\n|$)", part)
-        in_reply_to_match = re.search(r"\*\*In-Reply-To:\*\*\s*([a-f0-9]{7})(?:\n|$)", part)
-        status_match = re.search(r"\*\*Status:\*\*\s*CLAIMED by (.+?)(?:\n|$)", part)
-        claimed_at_match = re.search(r"\*\*Claimed At:\*\*\s*(.+?)(?:\n|$)", part)
-
-        # Extract values
-        from_agent = from_match.group(1).strip() if from_match else "Unknown"
-        date_str = date_match.group(1).strip() if date_match else str(date.today())
-        priority = priority_match.group(1).strip() if priority_match else "MEDIUM"
-        in_reply_to = in_reply_to_match.group(1).strip() if in_reply_to_match else None
-        status = status_match.group(1).strip() if status_match else None
-        claimed_at = claimed_at_match.group(1).strip() if claimed_at_match else None
-
-        # Get or generate ID
-        if id_match:
-            item_id = id_match.group(1)
-        else:
-            # Auto-generate ID for migration
-            item_id = generate_item_id(title, from_agent, date_str, priority)
-
-        # Extract body (everything after last metadata line)
-        # Body comes after Claimed At, Status, In-Reply-To, or Priority (in that order)
-        if claimed_at:
-            body_match = re.search(r"\*\*Claimed At:\*\*[^\n]*\n(.+)", part, re.DOTALL)
-        elif status:
-            body_match = re.search(r"\*\*Status:\*\*[^\n]*\n(.+)", part, re.DOTALL)
-        elif in_reply_to:
-            body_match = re.search(r"\*\*In-Reply-To:\*\*[^\n]*\n(.+)", part, re.DOTALL)
+    def __init__(self):
+        import threading
+
+        self.mutex = threading.Lock()
+        self.changed = threading.Condition()
+        self.generation = 0
+
+    def notify(self) -> None:
+        with self.changed:
+            self.generation += 1
+            self.changed.notify_all()
+
+    def watch(self) -> None:
+        """Thread body: turn filesystem change events into waiter wake-ups."""
+        with InboxWatcher() as watcher:
+            while True:
+                watcher.wait(WATCH_RECHECK)
+                self.notify()
+
+    def handle(self, request: dict) -> dict:
+        """Execute one request; raises InboxError for refused operations."""
+        op = request.get("op")
+        if op == "add_batch":
+            role = VALID_ROLES[0]  # Batch items carry their own roles, validated below
         else:
-            body_match = re.search(r"\*\*Priority:\*\*[^\n]*\n(.+)", part, re.DOTALL)
-        body = body_match.group(1).strip() if body_match else ""
-        # Unescape --- that were escaped during write
-        body = unescape_body_separators(body)
-
-        items.append(
-            {
-                "id": item_id,
-                "title": title,
-                "from": from_agent,
-                "date": date_str,
-                "priority": priority,
-                "in_reply_to": in_reply_to,  # Thread correlation for responses
-                "status": status,  # None if unclaimed, session-id if claimed
-                "claimed_at": claimed_at,  # ISO 8601 timestamp or None
-                "body": body,
-            }
-        )
-
-    return items
-
-
-def escape_body_separators(body: str) -> str:
-    """Escape --- in body to prevent parse_inbox from splitting on it."""
-    # Replace \n---\n with \n-​-​-\n (using zero-width spaces)
-    # This preserves visual appearance while preventing split
-    return body.replace("\n---\n", "\n-\u200b-\u200b-\n")
-
-
-def unescape_body_separators(body: str) -> str:
-    """Unescape --- in body after parsing."""
-    return body.replace("\n-\u200b-\u200b-\n", "\n---\n")
+            role = request.get("role")
+        for name in request.get("roles") or [role]:
+            if name not in VALID_ROLES:
+                raise InboxError(f"Unknown role '{name}'. Valid roles: {', '.join(VALID_ROLES)}")
+        for field in ("timeout", "lease", "aging"):  # Seconds or days; clients send JSON
+            value = request.get(field)
+            if value is not None and (
+                isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0
+            ):
+                raise InboxError(f"Invalid {field} {value!r}: expected a non-negative number.")
+        if request.get("backend", BACKEND) != BACKEND:
+            raise InboxError(
+                f"Broker serves the {BACKEND} backend, not {request['backend']}. "
+                "Set INBOX_BROKER=off to bypass it."
+            )
 
+        if op == "peek":
+            return peek_item(
+                role,
+                request.get("from"),
+                request.get("in_reply_to"),
+                request.get("order"),
+                request.get("aging"),
+            )
+        if op == "wait":
+            return self.wait(role, request)
+        if op == "take":
+            return self.take(role, request)
+
+        with self.mutex:
+            if op == "add":
+                spec = validate_batch_spec({**request, "role": role})
+                result = add_item(
+                    role,
+                    spec["title"],
+                    spec["from"],
+                    spec["priority"],
+                    str(request.get("body") or ""),
+                    spec["key"],
+                )
+            elif op == "add_batch":
+                items = request.get("items")
+                if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+                    raise InboxError("'items' must be a list of objects.")
+                result = {"results": add_batch([validate_batch_spec(item) for item in items])}
+            elif op == "claim":
+                result = claim_item(
+                    role, request["item_id"], request.get("session_id"), request.get("lease")
+                )
+            elif op == "renew":
+                result = renew_item(role, request["item_id"], request["token"], request.get("lease"))
+            elif op == "respond":
+                sender_role, response_item = respond_item(
+                    role, request["item_id"], request["token"], request["body"]
+                )
+                result = {"sender_role": sender_role, "item": response_item}
+            else:
+                raise InboxError(f"Unknown broker operation '{op}'.")
+        self.notify()
+        return result
+
+    def take(self, role: str, request: dict) -> dict:
+        with self.mutex:
+            result = take_item(
+                role,
+                request.get("from"),
+                request.get("in_reply_to"),
+                request.get("order"),
+                request.get("aging"),
+                request.get("session_id"),
+                request.get("lease"),
+            )
+        if result:
+            self.notify()
+        return result
+
+    def wait(self, role: str, request: dict) -> dict:
+        import time
+
+        roles = request.get("roles") or [role]
+        deadline = time.monotonic() + request.get("timeout", ROLE_TIMEOUTS.get(role, 300))
+        while True:
+            # Snapshot the generation first so a change during the check isn't lost
+            with self.changed:
+                generation = self.generation
+            for role in roles:
+                if request.get("claim"):
+                    output = self.take(role, request)
+                else:
+                    output = peek_item(
+                        role,
+                        request.get("from"),
+                        request.get("in_reply_to"),
+                        request.get("order"),
+                        request.get("aging"),
+                    )
+                if output:
+                    return {**output, "role": role} if len(roles) > 1 else output
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return {"timeout": True}
+            with self.changed:
+                self.changed.wait_for(lambda: self.generation != generation, timeout=remaining)
+
+    def serve(self, ready=None) -> None:
+        """
+        Accept connections until interrupted (one thread per connection).
+
+        `ready` is called once the socket is bound.
+        """
+        import json
+        import socketserver
+        import threading
+
+        broker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                request = {}
+                try:
+                    request = json.loads(line)
+                    trace_begin(f"serve:{request.get('op')}", request.get("role"))
+                    reply = {"ok": True, "result": broker.handle(request)}
+                except InboxError as e:
+                    reply = {"ok": False, "error": str(e)}
+                except Exception as e:  # Keep serving; report to the client
+                    reply = {"ok": False, "error": f"Broker error: {e!r}"}
+                trace_end(ok=reply["ok"])
+                self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+        broker_path = get_broker_path()
+        broker_path.parent.mkdir(parents=True, exist_ok=True)
+        if broker_request({"op": "peek", "role": VALID_ROLES[0]}) is not None:
+            raise InboxError(f"A broker is already listening on {broker_path}.")
+        broker_path.unlink(missing_ok=True)  # Stale socket from a crashed broker
+
+        threading.Thread(target=self.watch, daemon=True).start()
+        with socketserver.ThreadingUnixStreamServer(str(broker_path), Handler) as server:
+            server.daemon_threads = True
+            if ready:
+                ready()
+            try:
+                server.serve_forever()
+            finally:
+                if os.path.exists(broker_path):
+                    os.unlink(broker_path)
 
-def format_item(item: dict) -> str:
-    """Format an item as markdown with ID and optional claimed status."""
-    lines = [
-        f"## {item['title']}",
-        "",
-        f"**ID:** {item['id']}",
-        f"**From:** {item['from']}",
-        f"**Date:** {item['date']}",
-        f"**Priority:** {item['priority']}",
-    ]
-    # Add in_reply_to if present (for response threading)
-    if item.get("in_reply_to"):
-        lines.append(f"**In-Reply-To:** {item['in_reply_to']}")
-    # Add status line if claimed
-    if item.get("status"):
-        lines.append(f"**Status:** CLAIMED by {item['status']}")
-    # Add claimed_at timestamp if present
-    if item.get("claimed_at"):
-        lines.append(f"**Claimed At:** {item['claimed_at']}")
-    if item.get("body"):
-        lines.append("")
-        # Escape --- to prevent splitting issues
-        lines.append(escape_body_separators(item["body"]))
-    return "\n".join(lines)
 
+class Inbox:
+    """
+    In-process API for one role's inbox; the CLI commands are thin wrappers.
+
+    Methods return plain dicts (item JSON, as peek prints it) or None, and
+    raise InboxError instead of printing or exiting. Parsed state lives in
+    the store across calls (the markdown parse memo, the maildir
+    message cache, the SQLite connection), so a script doing many operations
+    re-reads only what changed and locks only inside each mutation. With
+    broker=True (the CLI's setting) operations go through a running
+    `inbox.py serve` when there is one.
+
+        desk = Inbox("desk")
+        item = desk.take(from_filter="coach")
+        if item:
+            desk.respond(item["id"], item["token"], "Done")
+    """
 
-def write_inbox(role: str, items: list[dict]) -> None:
-    """Write items to inbox file atomically."""
-    inbox_path = get_inbox_path(role)
-    inbox_path.parent.mkdir(parents=True, exist_ok=True)
+    def __init__(self, role: str, broker: bool = False):
+        role = role.lower()
+        if role not in VALID_ROLES:
+            raise InboxError(f"Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}")
+        self.role = role
+        self.broker = broker
+
+    def _brokered(self, op: str, **fields) -> dict | None:
+        """The broker's result for `op`, or None to run it directly."""
+        if not self.broker:
+            return None
+        return broker_request({"op": op, "role": self.role, **fields})
+
+    @staticmethod
+    def _filters(from_filter: str | None, in_reply_to: str | None) -> tuple[str | None, str | None]:
+        return (
+            from_filter.strip().lower() if from_filter else None,
+            in_reply_to.strip() if isinstance(in_reply_to, str) else in_reply_to,
+        )
 
-    header = f"# {role.capitalize()} Inbox\n\n---\n\n"  # Always --- after header
-    if items:
-        body = "\n\n---\n\n".join(format_item(item) for item in items)
-        content = header + body + "\n\n---\n\n"
-    else:
-        content = header
+    def items(self) -> list[dict]:
+        """
+        Every item, oldest first, with claim fields (status, claimed_at,
+        lease_until) and its body in line, even where it is stored as a blob.
+        """
+        return [inline_body(item) if "blob" in item else item for item in get_store().load(self.role)]
+
+    def add(
+        self,
+        title: str,
+        from_agent: str,
+        priority: str = "MEDIUM",
+        body: str = "",
+        key: str | None = None,
+    ) -> dict:
+        """Enqueue a message; returns it ("duplicate": True if `key` was already used)."""
+        priority = priority.upper()
+        if priority not in VALID_PRIORITIES:
+            raise InboxError(f"Invalid priority '{priority}'. Use: {', '.join(VALID_PRIORITIES)}")
+        fields = {"title": title, "from": from_agent, "priority": priority, "body": body, "key": key}
+        item = self._brokered("add", **fields)
+        return item if item is not None else add_item(self.role, title, from_agent, priority, body, key)
+
+    def peek(
+        self,
+        from_filter: str | None = None,
+        in_reply_to: str | None = None,
+        order: str | None = None,
+        aging: int | None = None,
+    ) -> dict | None:
+        """Next eligible unclaimed item (read-only), or None."""
+        from_filter, in_reply_to = self._filters(from_filter, in_reply_to)
+        order = order or DEQUEUE_ORDER
+        fields = {"from": from_filter, "in_reply_to": in_reply_to, "order": order, "aging": aging}
+        output = self._brokered("peek", **fields)
+        if output is None:
+            output = peek_item(self.role, from_filter, in_reply_to, order, aging)
+        return output or None
+
+    def wait(
+        self,
+        timeout: float | None = None,
+        from_filter: str | None = None,
+        in_reply_to: str | list[str] | None = None,
+        order: str | None = None,
+        aging: int | None = None,
+        claim: bool = False,
+        lease: int | None = None,
+    ) -> dict | None:
+        """
+        Block until an item is eligible (up to `timeout`, default the role's);
+        None on timeout. With claim=True the item is taken, as in take().
+        """
+        from_filter, in_reply_to = self._filters(from_filter, in_reply_to)
+        if timeout is None:
+            timeout = ROLE_TIMEOUTS.get(self.role, 300)
+        session_id = get_next_session_id(self.role) if claim else None
+        output = wait_item(
+            [self.role],
+            from_filter,
+            in_reply_to,
+            order or DEQUEUE_ORDER,
+            aging,
+            timeout,
+            session_id,
+            lease,
+            broker=self.broker,
+        )
+        return None if output.get("timeout") else output
+
+    def take(
+        self,
+        from_filter: str | None = None,
+        in_reply_to: str | None = None,
+        order: str | None = None,
+        aging: int | None = None,
+        lease: int | None = None,
+    ) -> dict | None:
+        """Claim the next eligible item; its JSON plus "token" and "lease_until", or None."""
+        from_filter, in_reply_to = self._filters(from_filter, in_reply_to)
+        order = order or DEQUEUE_ORDER
+        # Token is minted client-side so brokered takes keep per-process uniqueness
+        session_id = get_next_session_id(self.role)
+        output = self._brokered(
+            "take",
+            **{"from": from_filter},
+            in_reply_to=in_reply_to,
+            order=order,
+            aging=aging,
+            session_id=session_id,
+            lease=lease,
+        )
+        if output is None:
+            output = take_item(self.role, from_filter, in_reply_to, order, aging, session_id, lease)
+        return output or None
+
+    def claim(self, item_id: str, lease: int | None = None) -> dict:
+        """Claim an item by ID; its JSON plus "token" and "lease_until"."""
+        session_id = get_next_session_id(self.role)
+        item = self._brokered("claim", item_id=item_id, session_id=session_id, lease=lease)
+        if item is None:
+            item = claim_item(self.role, item_id, session_id, lease)
+        return {**item_to_json(item), "token": session_id, "lease_until": item.get("lease_until")}
+
+    def renew(self, item_id: str, token: str, lease: int | None = None) -> dict:
+        """Extend the lease on an item claimed with `token`; its JSON plus "lease_until"."""
+        item = self._brokered("renew", item_id=item_id, token=token, lease=lease)
+        if item is None:
+            item = renew_item(self.role, item_id, token, lease)
+        return {**item_to_json(item), "token": token, "lease_until": item.get("lease_until")}
+
+    def unclaim(self, item_id: str, token: str) -> dict | None:
+        """Release a claim; the item's JSON, or None if it was not claimed."""
+        item = unclaim_item(self.role, item_id, token)
+        return item_to_json(item) if item else None
+
+    def respond(self, item_id: str, token: str, body: str) -> dict:
+        """
+        Answer a claimed item (see respond_item); returns the response's JSON
+        with "role" set to the inbox it was delivered to.
+        """
+        if not body:
+            raise InboxError("Response body is required.")
+        if self.broker:
+            sender_role, response = send_response(self.role, item_id, token, body)
+        else:
+            sender_role, response = respond_item(self.role, item_id, token, body)
+        return {**item_to_json(response), "role": sender_role}
 
-    # Atomic write
-    with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".md") as f:
-        f.write(content)
-        temp_path = f.name
-    shutil.move(temp_path, inbox_path)
+    def delete(self, item_id: str) -> dict:
+        """Remove an item by ID (it moves to the archive); the deleted item's JSON."""
+        return item_to_json(delete_item(self.role, item_id))
 
 
 def cmd_read(args: argparse.Namespace) -> None:
@@ -240,19 +2760,20 @@ def cmd_read(args: argparse.Namespace) -> None:
         )
         sys.exit(1)
 
+    store = get_store()
     inbox_path = get_inbox_path(role)
-    if not inbox_path.exists():
+    if store.name == "markdown" and not inbox_path.exists():
         console.print(f"[yellow]{role.capitalize()} inbox is empty.[/yellow]")
         return
 
-    # Check if migration needed (quick check before locking)
-    content = inbox_path.read_text()
+    # Check if migration needed (quick check before locking; markdown files only)
+    content = inbox_path.read_text() if store.name == "markdown" else ""
     needs_migration = "**ID:**" not in content and content.strip()
 
     if needs_migration:
         # Re-read inside lock to prevent TOCTOU race
         lock_path = inbox_path.with_suffix(".lock")
-        with FileLock(lock_path, timeout=LOCK_TIMEOUT):
+        with file_lock(lock_path):
             content = inbox_path.read_text()
             # Re-check: another process may have migrated while we waited for lock
             if "**ID:**" not in content and content.strip():
@@ -262,7 +2783,7 @@ def cmd_read(args: argparse.Namespace) -> None:
             else:
                 items = parse_inbox(content)
     else:
-        items = parse_inbox(content)
+        items = store.load(role)
 
     if not items:
         console.print(f"[yellow]{role.capitalize()} inbox is empty.[/yellow]")
@@ -272,6 +2793,8 @@ def cmd_read(args: argparse.Namespace) -> None:
         f"\n[bold]{role.capitalize()} Inbox[/bold] ({len(items)} item{'s' if len(items) != 1 else ''})\n"
     )
 
+    from rich.panel import Panel
+
     for i, item in enumerate(items, 1):
         priority_color = {"HIGH": "red", "MEDIUM": "yellow", "LOW": "green"}.get(
             item["priority"], "white"
@@ -283,15 +2806,17 @@ def cmd_read(args: argparse.Namespace) -> None:
             session_parts = item["status"].split("-")
             session_role = session_parts[0] if session_parts else "unknown"
             session_abbrev = session_parts[-1] if session_parts else item["status"]
-            header = f"[{i}] ({item['id']}) [dim][CLAIMED by {session_role}-{session_abbrev}][/dim] {item['title']}"
+            claim = "CLAIM EXPIRED" if lease_expired(item) else "CLAIMED"
+            header = f"[{i}] ({item['id']}) [dim][{claim} by {session_role}-{session_abbrev}][/dim] {item['title']}"
         else:
             header = f"[{i}] ({item['id']}) {item['title']}"
 
         meta = f"From: {item['from']} | Date: {item['date']} | Priority: [{priority_color}]{item['priority']}[/{priority_color}]"
 
+        body = item_body(item)
         console.print(
             Panel(
-                f"{meta}\n\n{item['body']}" if item["body"] else meta,
+                f"{meta}\n\n{body}" if body else meta,
                 title=header,
                 title_align="left",
             )
@@ -304,155 +2829,310 @@ def cmd_peek(args: argparse.Namespace) -> None:
 
     With --from filter, only returns items from the specified sender role.
     With --in-reply-to filter, only returns responses to the specified message ID.
+    With --order priority, HIGH items come first (see InboxStore.select).
     """
     import json
 
-    role = args.role.lower()
-    if role not in VALID_ROLES:
-        console.print(
-            f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
+    try:
+        output = Inbox(args.role, broker=True).peek(
+            args.from_filter, args.in_reply_to, args.order, args.aging
         )
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
         sys.exit(1)
+    print(json.dumps(output or {}))
+
+
+def wait_item(
+    roles: str | list[str],
+    from_filter: str | None,
+    in_reply_to_filter: str | list[str] | None,
+    order: str,
+    aging: int | None,
+    timeout: float,
+    session_id: str | None = None,
+    lease: int | None = None,
+    broker: bool = True,
+) -> dict:
+    """
+    Block until an eligible item appears; return its JSON or {"timeout": True}.
 
-    # Parse optional filters
-    from_filter = args.from_filter.strip().lower() if args.from_filter else None
-    in_reply_to_filter = args.in_reply_to.strip() if args.in_reply_to else None
+    `roles` may name several inboxes and `in_reply_to_filter` several message
+    IDs; one watcher covers them all and the first role (in the order given)
+    with a match wins. With several roles the JSON carries "role".
 
-    inbox_path = get_inbox_path(role)
-    if not inbox_path.exists():
-        # Empty inbox - return empty object
-        print(json.dumps({}))
-        return
+    With `session_id` the item is taken (see take_item) under that token
+    and lease.
+    Uses the broker when one is running (unless broker=False), otherwise
+    watches the inboxes.
+    """
+    import time
+
+    roles = [roles] if isinstance(roles, str) else roles
+    start_time = time.time()
+    request = {
+        "op": "wait",
+        "role": roles[0],
+        "roles": roles,
+        "from": from_filter,
+        "in_reply_to": in_reply_to_filter,
+        "order": order,
+        "aging": aging,
+        "claim": session_id is not None,
+        "session_id": session_id,
+        "lease": lease,
+        "timeout": timeout,
+    }
+    output = broker_request(request, timeout=timeout + LOCK_TIMEOUT) if broker else None
+    if output is not None:
+        return output
+
+    # Watch before the first check so a write between check and sleep still wakes us
+    with InboxWatcher(roles) as watcher:
+        while True:
+            # Check if we have an item (lockless read is safe here)
+            # Safe because: (1) writes are atomic (os.replace / SQLite commit), (2) re-checks catch missed items
+            raced = False
+            for role in roles:
+                item = get_store().select(role, from_filter, in_reply_to_filter, order, aging)
+                if item and session_id:
+                    item = take_item(
+                        role, from_filter, in_reply_to_filter, order, aging, session_id, lease
+                    )
+                    raced = raced or not item  # Another worker took it first
+                elif item:
+                    item = item_to_json(item)
+                if item:
+                    return {**item, "role": role} if len(roles) > 1 else item
+            if raced:
+                continue  # Look again without sleeping
+
+            # Check timeout
+            elapsed = time.time() - start_time
+            if elapsed >= timeout:
+                # Timeout - no item available
+                return {"timeout": True}
+
+            # Block until an inbox changes (but not longer than remaining time)
+            watcher.wait(timeout - elapsed)
+
+
+def follow_items(
+    roles: list[str],
+    from_filter: str | None = None,
+    in_reply_to_filter: str | list[str] | None = None,
+    seen: dict[str, set[str]] | None = None,
+):
+    """
+    Yield (role, item) each time an item becomes available, forever.
+
+    An item becomes available when it arrives unclaimed or its claim is
+    released (unclaim, expired lease). `seen` maps role -> IDs already
+    delivered that are still available. An item is added to it in place
+    when the caller resumes the generator, i.e. after handling it, so an
+    item whose handling raised is never recorded; a caller persisting
+    `seen` inside its loop adds the item itself first. That gives a resume
+    cursor that neither replays nor skips items across restarts.
+    """
+    seen = seen if seen is not None else {}
+    with InboxWatcher(roles) as watcher:
+        while True:
+            for role in roles:
+                available = [
+                    item
+                    for item in get_store().load(role)
+                    if item_matches(item, from_filter, in_reply_to_filter)
+                ]
+                role_seen = seen.setdefault(role, set())
+                # Forget items that were claimed or removed; they yield again if released
+                role_seen &= {item["id"] for item in available}
+                for item in available:
+                    if item["id"] not in role_seen:
+                        yield role, item
+                        role_seen.add(item["id"])  # Handled: the caller came back for more
+            watcher.wait(WATCH_RECHECK)  # The periodic re-check also catches expired leases
+
+
+def read_cursor(path: Path) -> dict[str, set[str]]:
+    """Load a tail cursor file ({} if it doesn't exist yet)."""
+    import json
 
-    content = inbox_path.read_text()
-    items = parse_inbox(content)
+    try:
+        data = json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        raise InboxError(f"Cursor file {path} is not valid JSON.")
+    return {role: set(ids) for role, ids in data.get("seen", {}).items()}
 
-    # Find first unclaimed item (oldest by document order)
-    for item in items:
-        if item.get("status"):  # Skip claimed
-            continue
 
-        # Apply sender filter if provided (handles "role:name" format)
-        if from_filter:
-            item_sender = item.get("from", "").lower().split(":")[0]
-            if item_sender != from_filter:
-                continue
+def write_cursor(path: Path, seen: dict[str, set[str]]) -> None:
+    """Atomically replace a tail cursor file."""
+    import json
 
-        # Apply in_reply_to filter if provided (exact match)
-        if in_reply_to_filter:
-            if item.get("in_reply_to") != in_reply_to_filter:
-                continue
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"seen": {role: sorted(ids) for role, ids in seen.items()}}, f)
+    os.replace(temp_path, path)
 
-        # Return item as JSON (omit status field per Oracle)
-        output = {
-            "id": item["id"],
-            "title": item["title"],
-            "from": item["from"],
-            "date": item["date"],
-            "priority": item["priority"],
-            "body": item["body"],
-        }
-        if item.get("in_reply_to"):
-            output["in_reply_to"] = item["in_reply_to"]
-        print(json.dumps(output))
-        return
 
-    # No unclaimed items found (matching filter if provided)
-    print(json.dumps({}))
+def cmd_tail(args: argparse.Namespace) -> None:
+    """
+    Stream items as JSON lines as they become available (see follow_items).
+
+    With --cursor FILE the set of delivered items is saved after every line
+    and reloaded on start, so a restarted tailer resumes where it stopped
+    (at-least-once: a crash between printing and saving repeats one line).
+    """
+    import json
+    import signal
+
+    roles = []
+    for role in args.role:
+        role = role.lower()
+        if role not in VALID_ROLES:
+            console.print(
+                f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
+            )
+            sys.exit(1)
+        if role not in roles:
+            roles.append(role)
+
+    from_filter = args.from_filter.strip().lower() if args.from_filter else None
+    in_reply_to_filter = [i.strip() for i in args.in_reply_to] if args.in_reply_to else None
+    cursor_path = Path(args.cursor) if args.cursor else None
+
+    try:
+        seen = read_cursor(cursor_path) if cursor_path else {}
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
+        sys.exit(1)
+    if args.new_only:
+        # Treat everything available right now as already delivered
+        for role in roles:
+            seen[role] = {
+                item["id"]
+                for item in get_store().load(role)
+                if item_matches(item, from_filter, in_reply_to_filter)
+            }
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        for role, item in follow_items(roles, from_filter, in_reply_to_filter, seen):
+            sys.stdout.write(json.dumps({**item_to_json(item), "role": role}) + "\n")
+            sys.stdout.flush()
+            seen[role].add(item["id"])  # Delivered; a failed write above leaves it out
+            if cursor_path:
+                write_cursor(cursor_path, seen)
+    except BrokenPipeError:
+        # Reader went away; silence the interpreter's final flush
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    except KeyboardInterrupt:
+        pass
+    if cursor_path:
+        write_cursor(cursor_path, seen)
 
 
 def cmd_wait(args: argparse.Namespace) -> None:
     """
     Block until an unclaimed item is available or timeout occurs.
 
-    Returns item JSON or {"timeout": true}. Uses internal polling to avoid
-    wasteful tool calls - checks every 5 seconds internally.
+    Returns item JSON or {"timeout": true}. Blocks on inbox directory change
+    notifications (inotify on Linux) and re-checks on each change; falls back
+    to checking every POLL_INTERVAL seconds where inotify is unavailable.
 
     With --from filter, only waits for items from the specified sender role.
     Items from other senders are ignored (behavioral change from unfiltered wait).
 
     Timeout defaults are role-based (oracle=50min, engineer=3min) but can be
     overridden with --timeout flag.
+
+    With --claim, the item is taken (see take_item) and its JSON includes the
+    session token.
+
+    Several roles and several --in-reply-to IDs can be given; the first match
+    is returned, tagged with "role" when more than one role is watched.
     """
     import json
-    import time
 
-    role = args.role.lower()
-    if role not in VALID_ROLES:
-        console.print(
-            f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
-        )
-        sys.exit(1)
+    if len(args.role) == 1:
+        try:
+            output = Inbox(args.role[0], broker=True).wait(
+                args.timeout,
+                args.from_filter,
+                [i.strip() for i in args.in_reply_to] if args.in_reply_to else None,
+                args.order,
+                args.aging,
+                args.claim,
+                args.lease,
+            )
+        except InboxError as e:
+            console.print(f"[red]Error:[/red] {e}")
+            sys.exit(1)
+        print(json.dumps(output or {"timeout": True}))
+        return
+
+    # Several inboxes: one watcher over all of them (Inbox covers a single role)
+    roles = []
+    for role in args.role:
+        try:
+            role = Inbox(role).role
+        except InboxError as e:
+            console.print(f"[red]Error:[/red] {e}")
+            sys.exit(1)
+        if role not in roles:
+            roles.append(role)
 
     # Parse optional filters
     from_filter = args.from_filter.strip().lower() if args.from_filter else None
-    in_reply_to_filter = args.in_reply_to.strip() if args.in_reply_to else None
-
-    # Use explicit --timeout if provided, otherwise role-based default
-    timeout = args.timeout if args.timeout is not None else ROLE_TIMEOUTS.get(role, 300)
-    poll_interval = 5  # Check every 5 seconds
-    start_time = time.time()
-
-    while True:
-        # Check if we have an item (lockless read is safe here)
-        # Safe because: (1) write_inbox() uses atomic shutil.move(), (2) polling retries catch missed items
-        inbox_path = get_inbox_path(role)
-        if inbox_path.exists():
-            content = inbox_path.read_text()
-            items = parse_inbox(content)
-
-            # Find first unclaimed item (matching filter if provided)
-            for item in items:
-                if item.get("status"):  # Skip claimed
-                    continue
-
-                # Apply sender filter if provided (handles "role:name" format)
-                if from_filter:
-                    item_sender = item.get("from", "").lower().split(":")[0]
-                    if item_sender != from_filter:
-                        continue
+    in_reply_to_filter = [i.strip() for i in args.in_reply_to] if args.in_reply_to else None
 
-                # Apply in_reply_to filter if provided (exact match)
-                if in_reply_to_filter:
-                    if item.get("in_reply_to") != in_reply_to_filter:
-                        continue
+    # Use explicit --timeout if provided, otherwise role-based default (longest of the roles)
+    if args.timeout is not None:
+        timeout = args.timeout
+    else:
+        timeout = max(ROLE_TIMEOUTS.get(role, 300) for role in roles)
+    session_id = get_next_session_id(roles[0]) if args.claim else None
+
+    try:
+        output = wait_item(
+            roles,
+            from_filter,
+            in_reply_to_filter,
+            args.order or DEQUEUE_ORDER,
+            args.aging,
+            timeout,
+            session_id,
+            args.lease,
+        )
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
+        sys.exit(1)
+    print(json.dumps(output))
 
-                # Return item as JSON (omit status field)
-                output = {
-                    "id": item["id"],
-                    "title": item["title"],
-                    "from": item["from"],
-                    "date": item["date"],
-                    "priority": item["priority"],
-                    "body": item["body"],
-                }
-                if item.get("in_reply_to"):
-                    output["in_reply_to"] = item["in_reply_to"]
-                print(json.dumps(output))
-                return
 
-        # Check timeout
-        elapsed = time.time() - start_time
-        if elapsed >= timeout:
-            # Timeout - no item available
-            print(json.dumps({"timeout": True}))
-            return
+def cmd_take(args: argparse.Namespace) -> None:
+    """Claim the next eligible item and print it with its token as JSON ({} if none)."""
+    import json
 
-        # Sleep before next check (but don't sleep longer than remaining time)
-        remaining = timeout - elapsed
-        sleep_time = min(poll_interval, remaining)
-        if sleep_time > 0:
-            time.sleep(sleep_time)
+    try:
+        output = Inbox(args.role, broker=True).take(
+            args.from_filter, args.in_reply_to, args.order, args.aging, args.lease
+        )
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
+        sys.exit(1)
+    print(json.dumps(output or {}))
 
 
 def cmd_add(args: argparse.Namespace) -> None:
     """Add item to inbox with generated ID."""
-    role = args.role.lower()
-    if role not in VALID_ROLES:
-        console.print(
-            f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
-        )
+    try:
+        inbox = Inbox(args.role, broker=True)
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
         sys.exit(1)
+    role = inbox.role
 
     from_agent = args.from_agent
     if not from_agent:
@@ -479,239 +3159,173 @@ def cmd_add(args: argparse.Namespace) -> None:
     elif not sys.stdin.isatty():
         body = sys.stdin.read().strip()
 
-    # Generate ID for new item
-    date_str = str(date.today())
-    item_id = generate_item_id(args.title, from_agent, date_str, priority)
-
-    # Atomic read-modify-write with file locking
-    inbox_path = get_inbox_path(role)
-    lock_path = inbox_path.with_suffix(".lock")
-
-    with FileLock(lock_path, timeout=LOCK_TIMEOUT):
-        # Read current inbox
-        items = parse_inbox(inbox_path.read_text()) if inbox_path.exists() else []
-
-        # Add new item
-        items.append(
-            {
-                "id": item_id,
-                "title": args.title,
-                "from": from_agent,
-                "date": date_str,
-                "priority": priority,
-                "body": body,
-            }
-        )
-
-        # Write back atomically
-        write_inbox(role, items)
-
-    console.print(f"[green]Added item to {role} inbox:[/green] {args.title} [dim]({item_id})[/dim]")
+    key = args.key
+    if not key and args.dedup:
+        key = content_key(role, {"title": args.title, "from": from_agent, "priority": priority, "body": body})
 
+    try:
+        item = inbox.add(args.title, from_agent, priority, body, key)
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
+        sys.exit(1)
 
-def cmd_delete(args: argparse.Namespace) -> None:
-    """Delete item from inbox by ID or index."""
-    role = args.role.lower()
-    if role not in VALID_ROLES:
+    if item.get("duplicate"):
         console.print(
-            f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
+            f"[yellow]Already in {role} inbox (same key):[/yellow] {args.title} [dim]({item['id']})[/dim]"
         )
-        sys.exit(1)
-
-    id_or_index = args.id_or_index
-    inbox_path = get_inbox_path(role)
-    lock_path = inbox_path.with_suffix(".lock")
-
-    # Atomic read-modify-write with file locking
-    with FileLock(lock_path, timeout=LOCK_TIMEOUT):
-        items = parse_inbox(inbox_path.read_text()) if inbox_path.exists() else []
-
-        if not items:
-            console.print(f"[red]Error:[/red] {role.capitalize()} inbox is empty.")
-            sys.exit(1)
+        return
+    console.print(f"[green]Added item to {role} inbox:[/green] {args.title} [dim]({item['id']})[/dim]")
 
-        # Try to parse as ID first (7-char hex string)
-        if re.match(r"^[a-f0-9]{7}$", id_or_index):
-            # Delete by ID
-            item_id = id_or_index
-            deleted_idx = None
-            for idx, item in enumerate(items):
-                if item["id"] == item_id:
-                    deleted_idx = idx
-                    break
 
-            if deleted_idx is None:
-                console.print(f"[red]Error:[/red] No item found with ID '{item_id}'.")
-                sys.exit(1)
+def cmd_add_batch(args: argparse.Namespace) -> None:
+    """
+    Add many items from JSONL, one lock and one write per target inbox.
 
-            deleted = items.pop(deleted_idx)
-            write_inbox(role, items)
-            console.print(f"[green]Deleted from {role} inbox:[/green] {deleted['title']}")
+    Every line is validated before anything is written; one bad line
+    rejects the whole batch. Prints one JSON result per input line.
+    """
+    import json
 
+    try:
+        if args.file:
+            lines = Path(args.file).read_text().splitlines()
         else:
-            # Try to parse as integer index
-            try:
-                index = int(id_or_index)
-            except ValueError:
-                console.print(
-                    f"[red]Error:[/red] '{id_or_index}' is not a valid ID (7-char hex) or index (integer)."
-                )
-                sys.exit(1)
-
-            if index < 1 or index > len(items):
-                console.print(
-                    f"[red]Error:[/red] {role.capitalize()} inbox has {len(items)} item(s). Cannot delete item {index}."
-                )
-                sys.exit(1)
-
-            deleted = items[index - 1]
-
-            # Show warning about concurrent access
-            console.print(
-                f"[yellow]Warning:[/yellow] Using index is unsafe with concurrent agents. Use ID instead: [bold]{deleted['id']}[/bold]"
-            )
-
-            items.pop(index - 1)
-            write_inbox(role, items)
-            console.print(f"[green]Deleted from {role} inbox:[/green] {deleted['title']}")
-
-
-def cmd_claim(args: argparse.Namespace) -> None:
-    """Claim an inbox item for exclusive work."""
-    role = args.role.lower()
-    if role not in VALID_ROLES:
-        console.print(
-            f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
-        )
+            lines = sys.stdin.read().splitlines()
+    except OSError as e:
+        print(f"Error: Cannot read batch file: {e}", file=sys.stderr)
         sys.exit(1)
 
-    item_id = args.item_id
-    session_id = get_next_session_id(role)
-    inbox_path = get_inbox_path(role)
-    lock_path = inbox_path.with_suffix(".lock")
-
-    # Atomic read-modify-write with file locking
-    from datetime import datetime, timezone
-
-    with FileLock(lock_path, timeout=LOCK_TIMEOUT):
-        items = parse_inbox(inbox_path.read_text()) if inbox_path.exists() else []
-
-        if not items:
-            console.print(f"[red]Error:[/red] {role.capitalize()} inbox is empty.")
-            sys.exit(1)
-
-        # Find item by ID
-        found_idx = None
-        for idx, item in enumerate(items):
-            if item["id"] == item_id:
-                found_idx = idx
-                break
-
-        if found_idx is None:
-            console.print(f"[red]Error:[/red] No item found with ID '{item_id}'.")
-            sys.exit(1)
-
-        item = items[found_idx]
-
-        # Check if already claimed
-        if item.get("status"):
-            console.print(
-                f"[red]Error:[/red] Item already claimed by session: [bold]{item['status']}[/bold]"
-            )
+    specs = []
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            spec = parse_batch_line(line)
+        except InboxError as e:
+            print(f"Error: line {line_no}: {e}", file=sys.stderr)
             sys.exit(1)
+        if args.dedup and not spec["key"]:
+            spec["key"] = content_key(spec["role"], spec)
+        specs.append(spec)
+
+    try:
+        reply = broker_request({"op": "add_batch", "items": specs})
+        results = reply["results"] if reply is not None else add_batch(specs)
+    except InboxError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
 
-        # Update item with claimed status and timestamp
-        items[found_idx]["status"] = session_id
-        items[found_idx]["claimed_at"] = datetime.now(timezone.utc).isoformat()
-
-        write_inbox(role, items)
-
-    console.print(
-        f"[green]Claimed:[/green] {item['title']}\n[dim]Session token:[/dim] [bold]{session_id}[/bold]"
-    )
+    for result in results:
+        print(json.dumps(result))
 
 
-def cmd_unclaim(args: argparse.Namespace) -> None:
-    """Unclaim an inbox item (requires matching token)."""
-    role = args.role.lower()
-    if role not in VALID_ROLES:
-        console.print(
-            f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
-        )
+def cmd_delete(args: argparse.Namespace) -> None:
+    """Delete item from inbox by ID or index."""
+    try:
+        inbox = Inbox(args.role)
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
         sys.exit(1)
+    role = inbox.role
+    id_or_index = args.id_or_index
 
-    item_id = args.item_id
-    token = args.token
-    inbox_path = get_inbox_path(role)
-    lock_path = inbox_path.with_suffix(".lock")
-
-    # Atomic read-modify-write with file locking
-    with FileLock(lock_path, timeout=LOCK_TIMEOUT):
-        items = parse_inbox(inbox_path.read_text()) if inbox_path.exists() else []
+    # Try to parse as ID first (7-char hex string)
+    if re.match(r"^[a-f0-9]{7}$", id_or_index):
+        item_id = id_or_index
+    else:
+        # Try to parse as integer index
+        try:
+            index = int(id_or_index)
+        except ValueError:
+            console.print(
+                f"[red]Error:[/red] '{id_or_index}' is not a valid ID (7-char hex) or index (integer)."
+            )
+            sys.exit(1)
 
+        items = inbox.items()
         if not items:
             console.print(f"[red]Error:[/red] {role.capitalize()} inbox is empty.")
             sys.exit(1)
+        if index < 1 or index > len(items):
+            console.print(
+                f"[red]Error:[/red] {role.capitalize()} inbox has {len(items)} item(s). Cannot delete item {index}."
+            )
+            sys.exit(1)
+        item_id = items[index - 1]["id"]
 
-        # Find item by ID
-        found_idx = None
-        for idx, item in enumerate(items):
-            if item["id"] == item_id:
-                found_idx = idx
-                break
+        # Show warning about concurrent access
+        console.print(
+            f"[yellow]Warning:[/yellow] Using index is unsafe with concurrent agents. Use ID instead: [bold]{item_id}[/bold]"
+        )
 
-        if found_idx is None:
-            console.print(f"[red]Error:[/red] No item found with ID '{item_id}'.")
-            sys.exit(1)
+    try:
+        deleted = inbox.delete(item_id)
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
+        sys.exit(1)
+    console.print(f"[green]Deleted from {role} inbox:[/green] {deleted['title']}")
 
-        item = items[found_idx]
 
-        # Check if claimed
-        if not item.get("status"):
-            console.print(f"[yellow]Warning:[/yellow] Item is not claimed.")
-            sys.exit(0)
+def cmd_claim(args: argparse.Namespace) -> None:
+    """Claim an inbox item for exclusive work."""
+    try:
+        item = Inbox(args.role, broker=True).claim(args.item_id, args.lease)
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
+        sys.exit(1)
 
-        # Verify token matches
-        if item["status"] != token:
-            console.print(
-                f"[red]Error:[/red] Cannot unclaim: token mismatch.\n"
-                f"Item claimed by: [bold]{item['status']}[/bold]\n"
-                f"Your token: [bold]{token}[/bold]"
-            )
-            sys.exit(1)
+    console.print(
+        f"[green]Claimed:[/green] {item['title']}\n[dim]Session token:[/dim] [bold]{item['token']}[/bold]"
+    )
+    if item.get("lease_until"):
+        console.print(f"[dim]Lease until:[/dim] {item['lease_until']} (extend with renew)")
 
-        # Remove claim and timestamp
-        items[found_idx]["status"] = None
-        items[found_idx]["claimed_at"] = None
 
-        write_inbox(role, items)
+def cmd_renew(args: argparse.Namespace) -> None:
+    """Extend the lease on a claimed item (heartbeat)."""
+    try:
+        item = Inbox(args.role, broker=True).renew(args.item_id, args.token, args.lease)
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
+        sys.exit(1)
+
+    console.print(
+        f"[green]Renewed:[/green] {item['title']} [dim](lease until {item['lease_until'] or 'never expires'})[/dim]"
+    )
+
+
+def cmd_unclaim(args: argparse.Namespace) -> None:
+    """Unclaim an inbox item (requires matching token)."""
+    try:
+        inbox = Inbox(args.role)
+        item = inbox.unclaim(args.item_id, args.token)
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
+        sys.exit(1)
 
+    if item is None:
+        console.print(f"[yellow]Warning:[/yellow] Item is not claimed.")
+        sys.exit(0)
     console.print(f"[green]Unclaimed:[/green] {item['title']}")
 
 
-def cmd_respond(args: argparse.Namespace) -> None:
-    """
-    Best-effort atomic operation: respond to claimed item.
+def send_response(role: str, item_id: str, token: str, body: str) -> tuple[str, dict]:
+    """respond_item through the broker when one is running, else directly."""
+    request = {"op": "respond", "role": role, "item_id": item_id, "token": token, "body": body}
+    result = broker_request(request)
+    if result is None:
+        return respond_item(role, item_id, token, body)
+    return result["sender_role"], result["item"]
 
-    WARNING: Not fully atomic - if process crashes between delete and respond,
-    the message will be lost. Acceptable for agent communication use case.
 
-    1. Read both inboxes (original + sender's)
-    2. Verify token matches claimed item
-    3. Delete original item
-    4. Add response to sender's inbox
-    """
-    role = args.role.lower()
-    if role not in VALID_ROLES:
-        print(
-            f"Error: Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}",
-            file=sys.stderr,
-        )
+def cmd_respond(args: argparse.Namespace) -> None:
+    """Respond to a claimed item (see respond_item)."""
+    try:
+        inbox = Inbox(args.role, broker=True)
+    except InboxError as e:
+        print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
-    item_id = args.item_id
-    token = args.token
-
     # Read body: --body-file takes precedence, then --body, then stdin
     body = ""
     if args.body_file:
@@ -729,103 +3343,301 @@ def cmd_respond(args: argparse.Namespace) -> None:
         print("Error: Response body is required (--body, --body-file, or stdin).", file=sys.stderr)
         sys.exit(1)
 
-    inbox_path = get_inbox_path(role)
-    lock_path = inbox_path.with_suffix(".lock")
+    try:
+        response = inbox.respond(args.item_id, args.token, body)
+    except InboxError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
 
-    # First pass: verify and prepare (read-only, minimal locking)
-    with FileLock(lock_path, timeout=LOCK_TIMEOUT):
-        items = parse_inbox(inbox_path.read_text()) if inbox_path.exists() else []
+    console.print(
+        f"[green]Responded to {response['role']}:[/green] {response['title']} [dim]({response['id']})[/dim]"
+    )
 
-        if not items:
-            print(f"Error: {role.capitalize()} inbox is empty.", file=sys.stderr)
-            sys.exit(1)
 
-        # Find item by ID
-        found_idx = None
-        for idx, item in enumerate(items):
-            if item["id"] == item_id:
-                found_idx = idx
-                break
+class InboxConsumer:
+    """
+    Worker pool behind `inbox.py consume`.
+
+    Each worker thread takes items atomically (wait_item with its own token),
+    pipes the item JSON (including "token") to `command` on stdin and posts
+    the command's stdout back with send_response. While a handler runs its
+    claim lease is renewed every third of the lease. Items whose handler
+    exits non-zero, prints nothing or times out stay claimed until the lease
+    runs out (or unclaim_stale), then become available for another attempt.
+    Per-item progress and warnings are printed to `log`.
+    """
 
-        if found_idx is None:
-            print(f"Error: No item found with ID '{item_id}'.", file=sys.stderr)
-            sys.exit(1)
+    def __init__(
+        self,
+        role: str,
+        command: str,
+        workers: int = 1,
+        item_timeout: float | None = None,
+        from_filter: str | None = None,
+        order: str = "fifo",
+        aging: int | None = None,
+        max_items: int | None = None,
+        idle_exit: float | None = None,
+        lease: int | None = None,
+        log: LazyConsole = console,
+    ):
+        import threading
+        import time
+
+        self.role = role
+        self.command = command
+        self.workers = workers
+        self.item_timeout = item_timeout
+        self.from_filter = from_filter
+        self.order = order
+        self.aging = aging
+        self.max_items = max_items
+        self.idle_exit = idle_exit
+        self.lease = LEASE_SECONDS if lease is None else lease
+        self.log = log
+
+        self.stop = threading.Event()
+        self.mutex = threading.Lock()
+        self.taken = 0  # Items reserved or taken, counted against max_items
+        self.active = 0  # Items whose handler is running
+        self.results: list[tuple[str, float, float]] = []  # (outcome, handler s, total s)
+        self.last_activity = time.monotonic()
+        self.elapsed = 0.0
+
+    def run(self) -> None:
+        """Run workers until max_items, idle_exit or Ctrl-C (in-flight items finish)."""
+        import threading
+        import time
+
+        start = time.monotonic()
+        threads = [
+            threading.Thread(target=self.work, args=(n,), daemon=True) for n in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop.set()
+            self.log.print("[dim]Stopping; waiting for in-flight items...[/dim]")
+            for thread in threads:
+                thread.join()
+        self.elapsed = time.monotonic() - start
+
+    def reserve(self) -> bool:
+        """Count one more item against max_items; False once the budget is spent."""
+        with self.mutex:
+            if self.max_items is not None and self.taken >= self.max_items:
+                return False
+            self.taken += 1
+            return True
+
+    def release(self) -> None:
+        """Return a reservation that didn't turn into an item."""
+        import time
+
+        with self.mutex:
+            self.taken -= 1
+            if self.active == 0 and self.idle_exit is not None:
+                if time.monotonic() - self.last_activity >= self.idle_exit:
+                    self.stop.set()
+
+    def work(self, worker: int) -> None:
+        """Thread body; trace records are per thread, so each worker writes its own."""
+        trace_begin("consume:worker", self.role)
+        try:
+            self.work_items(worker)
+        finally:
+            trace_end(worker=worker)
 
-        item = items[found_idx]
+    def work_items(self, worker: int) -> None:
+        import time
 
-        # Verify item is claimed
-        if not item.get("status"):
-            print("Error: Item is not claimed. Cannot respond to unclaimed item.", file=sys.stderr)
-            sys.exit(1)
+        wait_slice = POLL_INTERVAL if self.idle_exit is None else min(POLL_INTERVAL, self.idle_exit)
+        while not self.stop.is_set():
+            if not self.reserve():
+                return
+            # Threads share a PID, so the worker number keeps tokens distinct
+            session_id = f"{get_next_session_id(self.role)}.{worker}"
+            try:
+                item = wait_item(
+                    self.role,
+                    self.from_filter,
+                    None,
+                    self.order,
+                    self.aging,
+                    wait_slice,
+                    session_id,
+                    self.lease,
+                )
+            except InboxError as e:
+                self.log.print(f"[red]Error:[/red] {e}")
+                self.release()
+                self.stop.set()
+                return
+            if not item or item.get("timeout"):
+                self.release()
+                continue
+            with self.mutex:
+                self.active += 1
+                self.last_activity = time.monotonic()
+            self.handle(item)
+
+    def renew_until(self, item: dict, done) -> None:
+        """Heartbeat: renew the item's lease until `done` is set."""
+        while not done.wait(self.lease / 3):
+            request = {
+                "op": "renew",
+                "role": self.role,
+                "item_id": item["id"],
+                "token": item["token"],
+                "lease": self.lease,
+            }
+            try:
+                if broker_request(request) is None:
+                    renew_item(self.role, item["id"], item["token"], self.lease)
+            except InboxError as e:
+                self.log.print(f"[yellow]Warning:[/yellow] Lease renewal failed for {item['id']}: {e}")
+                return
 
-        # Verify token matches
-        if item["status"] != token:
-            print(
-                f"Error: Cannot respond: token mismatch.\n"
-                f"Item claimed by: {item['status']}\n"
-                f"Your token: {token}",
-                file=sys.stderr,
+    def handle(self, item: dict) -> None:
+        """Run the handler for one taken item and respond with its output."""
+        import json
+        import subprocess
+        import threading
+        import time
+
+        start = time.monotonic()
+        env = {
+            **os.environ,
+            "INBOX_ROLE": self.role,
+            "INBOX_ITEM_ID": item["id"],
+            "INBOX_TOKEN": item["token"],
+        }
+        handler_time = None
+        heartbeat = None
+        if self.lease > 0:
+            heartbeat = threading.Event()
+            threading.Thread(target=self.renew_until, args=(item, heartbeat), daemon=True).start()
+        try:
+            proc = subprocess.run(
+                self.command,
+                shell=True,
+                input=json.dumps(item),
+                stdout=subprocess.PIPE,
+                text=True,
+                env=env,
+                timeout=self.item_timeout,
             )
-            sys.exit(1)
+        except subprocess.TimeoutExpired:
+            outcome, reason = "timeout", f"no result after {self.item_timeout}s"
+        else:
+            handler_time = time.monotonic() - start
+            if heartbeat:
+                heartbeat.set()  # Stop renewing before we respond
+            body = proc.stdout.strip()
+            if proc.returncode != 0:
+                outcome, reason = "failed", f"handler exited {proc.returncode}"
+            elif not body:
+                outcome, reason = "failed", "handler printed nothing"
+            else:
+                try:
+                    send_response(self.role, item["id"], item["token"], body)
+                    outcome, reason = "responded", ""
+                except InboxError as e:
+                    outcome, reason = "failed", str(e)
+        total_time = time.monotonic() - start
+        if heartbeat:
+            heartbeat.set()
+
+        if outcome == "responded":
+            self.log.print(
+                f"[green]Responded:[/green] {item['id']} {item['title']} [dim]({total_time * 1000:.0f} ms)[/dim]"
+            )
+        else:
+            self.log.print(
+                f"[yellow]Left claimed:[/yellow] {item['id']} {item['title']} [dim]({reason})[/dim]"
+            )
+        with self.mutex:
+            self.results.append((outcome, handler_time or total_time, total_time))
+            self.active -= 1
+            self.last_activity = time.monotonic()
+
+    def summary(self) -> dict:
+        """Counts, throughput and latency percentiles (ms) for the run so far."""
+
+        def percentiles(samples: list[float]) -> dict:
+            if not samples:
+                return {}
+            ordered = sorted(samples)
+            pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+            return {"p50": pick(0.50), "p95": pick(0.95), "max": round(ordered[-1] * 1000, 1)}
+
+        outcomes = [result[0] for result in self.results]
+        return {
+            "items": len(self.results),
+            "responded": outcomes.count("responded"),
+            "failed": outcomes.count("failed"),
+            "timeout": outcomes.count("timeout"),
+            "workers": self.workers,
+            "elapsed_s": round(self.elapsed, 3),
+            "items_per_s": round(len(self.results) / self.elapsed, 2) if self.elapsed else 0.0,
+            "handler_ms": percentiles([result[1] for result in self.results]),
+            "total_ms": percentiles([result[2] for result in self.results]),
+        }
 
-        # Determine sender (where to send response)
-        # Handle "role:name" format (e.g., "engineer:swift-falcon" → "engineer")
-        sender_role = item.get("from", "").lower().split(":")[0]
 
-    # Validate sender role (outside lock)
-    if sender_role not in VALID_ROLES:
-        print(
-            f"Error: Invalid sender role '{sender_role}' in item. Cannot send response.",
-            file=sys.stderr,
+def cmd_consume(args: argparse.Namespace) -> None:
+    """Take items with a pool of workers running --exec (see InboxConsumer)."""
+    import json
+    import signal
+
+    role = args.role.lower()
+    if role not in VALID_ROLES:
+        console.print(
+            f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
         )
         sys.exit(1)
+    if args.workers < 1:
+        console.print("[red]Error:[/red] --workers must be at least 1.")
+        sys.exit(1)
 
-    # CRITICAL: Sequential locks to prevent deadlock (lock 1, release, then lock 2)
-    # Delete from our inbox
-    with FileLock(lock_path, timeout=LOCK_TIMEOUT):
-        items = parse_inbox(inbox_path.read_text()) if inbox_path.exists() else []
-
-        # Re-find and delete item
-        found_idx = None
-        for idx, item in enumerate(items):
-            if item["id"] == item_id:
-                found_idx = idx
-                break
-
-        if found_idx is None:
-            print(f"Error: Item disappeared during respond operation.", file=sys.stderr)
-            sys.exit(1)
-
-        item = items.pop(found_idx)
-        write_inbox(role, items)
-
-        # Prepare response
-        response_title = f"Re: {item['title']}"
-        response_item = {
-            "id": generate_item_id(response_title, role, str(date.today()), item["priority"]),
-            "title": response_title,
-            "from": role,
-            "date": str(date.today()),
-            "priority": item["priority"],
-            "body": body,
-            "in_reply_to": item_id,  # Thread correlation - lets sender wait for this specific response
-        }
-    # Lock released here
-
-    # Write to sender's inbox (new lock, prevents deadlock)
-    sender_inbox_path = get_inbox_path(sender_role)
-    sender_lock_path = sender_inbox_path.with_suffix(".lock")
-
-    with FileLock(sender_lock_path, timeout=LOCK_TIMEOUT):
-        sender_items = (
-            parse_inbox(sender_inbox_path.read_text()) if sender_inbox_path.exists() else []
-        )
-        sender_items.append(response_item)
-        write_inbox(sender_role, sender_items)
+    # SIGTERM drains like Ctrl-C: stop taking, finish in-flight items, report
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    consumer = InboxConsumer(
+        role,
+        args.exec_command,
+        workers=args.workers,
+        item_timeout=args.item_timeout,
+        from_filter=args.from_filter.strip().lower() if args.from_filter else None,
+        order=args.order or DEQUEUE_ORDER,
+        aging=args.aging,
+        max_items=args.max_items,
+        idle_exit=args.idle_exit,
+        lease=args.lease,
+        log=LazyConsole(stderr=True) if args.json else console,  # Keep stdout pure JSON
+    )
+    consumer.run()
 
+    summary = consumer.summary()
+    if args.json:
+        print(json.dumps(summary))
+        return
+    console.print(
+        f"\n[bold]Consumed {summary['items']} item(s)[/bold] in {summary['elapsed_s']:.1f}s "
+        f"with {summary['workers']} worker(s) ({summary['items_per_s']} items/s)"
+    )
     console.print(
-        f"[green]Responded to {sender_role}:[/green] {response_title} [dim]({response_item['id']})[/dim]"
+        f"  responded: {summary['responded']}  failed: {summary['failed']}  timed out: {summary['timeout']}"
     )
+    for label, key in (("handler", "handler_ms"), ("take→respond", "total_ms")):
+        if summary[key]:
+            stats = summary[key]
+            console.print(
+                f"  {label} ms: p50 {stats['p50']}  p95 {stats['p95']}  max {stats['max']}"
+            )
 
 
 def cmd_unclaim_stale(args: argparse.Namespace) -> None:
@@ -842,12 +3654,12 @@ def cmd_unclaim_stale(args: argparse.Namespace) -> None:
     older_than = args.older_than  # seconds
     now = datetime.now(timezone.utc)
     unclaimed = []
-    inbox_path = get_inbox_path(role)
-    lock_path = inbox_path.with_suffix(".lock")
+    changed = []
+    store = get_store()
 
-    # Atomic read-modify-write with file locking
-    with FileLock(lock_path, timeout=LOCK_TIMEOUT):
-        items = parse_inbox(inbox_path.read_text()) if inbox_path.exists() else []
+    # Atomic read-modify-write under the inbox lock
+    with store.lock(role):
+        items = store.load(role)
 
         if not items:
             console.print(f"[yellow]{role.capitalize()} inbox is empty.[/yellow]")
@@ -876,6 +3688,8 @@ def cmd_unclaim_stale(args: argparse.Namespace) -> None:
                     # Mark for unclaim
                     item["status"] = None
                     item["claimed_at"] = None
+                    item["lease_until"] = None
+                    changed.append(item)
                     unclaimed.append(
                         {"title": item["title"], "id": item["id"], "age_seconds": age_seconds}
                     )
@@ -887,7 +3701,7 @@ def cmd_unclaim_stale(args: argparse.Namespace) -> None:
 
         # Write back if any changes
         if unclaimed:
-            write_inbox(role, items)
+            store.save(role, items, changed=changed)
 
     # Report results (outside lock)
     if unclaimed:
@@ -907,6 +3721,268 @@ def cmd_unclaim_stale(args: argparse.Namespace) -> None:
         console.print(f"[dim]No stale claims found (threshold: {older_than}s).[/dim]")
 
 
+def compact_inbox(role: str, older_than_days: int) -> list[dict]:
+    """
+    Archive unclaimed items dated more than `older_than_days` ago and rewrite
+    the hot inbox without them. Returns the archived items.
+    """
+    from datetime import timedelta
+
+    cutoff = date.today() - timedelta(days=older_than_days)
+    store = get_store()
+    with store.lock(role):
+        items = store.load(role)
+        stale, keep = [], []
+        for item in items:
+            try:
+                is_stale = not item.get("status") and date.fromisoformat(item["date"]) < cutoff
+            except ValueError:
+                is_stale = False  # Unparseable date: leave it for a human
+            (stale if is_stale else keep).append(item)
+        if stale:
+            archive_items(role, stale, "compacted")
+            store.save(role, keep, removed=stale)
+    return stale
+
+
+def cmd_compact(args: argparse.Namespace) -> None:
+    """Move old unclaimed items from the hot inbox into the archive."""
+    role = args.role.lower()
+    if role not in VALID_ROLES:
+        console.print(
+            f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
+        )
+        sys.exit(1)
+
+    archived = compact_inbox(role, args.older_than)
+    if archived:
+        console.print(f"[green]Archived {len(archived)} item(s) from {role} inbox:[/green]")
+        for item in archived:
+            console.print(f"  - {item['id']}: {item['title']} ({item['date']})")
+    else:
+        console.print(f"[dim]Nothing older than {args.older_than} day(s) to compact.[/dim]")
+    pruned = prune_blobs()
+    if pruned:
+        console.print(f"[dim]Removed {pruned} unreferenced body blob(s).[/dim]")
+
+
+def thread_items(item_id: str) -> list[dict]:
+    """
+    Reconstruct the conversation containing `item_id` across every inbox
+    and the archive.
+
+    Walks In-Reply-To links up to the root, then down through replies,
+    using each inbox's id / in_reply_to lookups and the archive's reply
+    index rather than scanning items. Returns records in thread order (root
+    first, replies after their parent), each tagged with "role", "depth" and
+    "location" ("inbox" or "archive").
+    """
+    store = get_store()
+    inboxes = {role: store.load_indexed(role) for role in VALID_ROLES}
+
+    def find(wanted: str) -> dict | None:
+        for role, (items, lookups) in inboxes.items():
+            pos = find_item_index(items, wanted, lookups)
+            if pos is not None:
+                return {**inline_body(items[pos]), "role": role, "location": "inbox"}
+        for role in VALID_ROLES:
+            for record in read_archive(role, item_id=wanted):
+                return {**record, "role": role, "location": "archive"}
+        return None
+
+    def replies(parent: str) -> list[dict]:
+        found = []
+        for role, (items, lookups) in inboxes.items():
+            for pos in lookups["in_reply_to"].get(parent, []):
+                found.append({**inline_body(items[pos]), "role": role, "location": "inbox"})
+            for record in read_archive(role, in_reply_to=parent):
+                found.append({**record, "role": role, "location": "archive"})
+        return found
+
+    item = find(item_id)
+    if item is None:
+        raise InboxError(f"No item found with ID '{item_id}' in any inbox or archive.")
+    visited = {item["id"]}
+    while item.get("in_reply_to") and item["in_reply_to"] not in visited:
+        parent = find(item["in_reply_to"])
+        if parent is None:
+            break  # Parent gone (deleted before archiving existed): start here
+        visited.add(parent["id"])
+        item = parent
+
+    thread = []
+    stack = [(item, 0)]
+    seen = set()
+    while stack:
+        record, depth = stack.pop()
+        if record["id"] in seen:
+            continue
+        seen.add(record["id"])
+        thread.append({**record, "depth": depth})
+        # Reversed so the first reply is visited first
+        stack.extend((reply, depth + 1) for reply in reversed(replies(record["id"])))
+    return thread
+
+
+def cmd_thread(args: argparse.Namespace) -> None:
+    """Print a conversation as JSON lines, root first (see thread_items)."""
+    import json
+
+    if not ITEM_ID_RE.fullmatch(args.item_id):
+        console.print(f"[red]Error:[/red] '{args.item_id}' is not a valid ID (7-char hex).")
+        sys.exit(1)
+    try:
+        thread = thread_items(args.item_id)
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
+        sys.exit(1)
+    for record in thread:
+        print(json.dumps(record))
+
+
+def cmd_history(args: argparse.Namespace) -> None:
+    """Print archived items as JSON lines (oldest first)."""
+    import json
+
+    role = args.role.lower()
+    if role not in VALID_ROLES:
+        console.print(
+            f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
+        )
+        sys.exit(1)
+
+    from_filter = args.from_filter.strip().lower() if args.from_filter else None
+    records = read_archive(role, month=args.month, item_id=args.item_id)
+    if from_filter:
+        records = [r for r in records if r.get("from", "").lower().split(":")[0] == from_filter]
+    if args.limit:
+        records = records[-args.limit :]
+    for record in records:
+        print(json.dumps(record))
+
+
+def cmd_export(args: argparse.Namespace) -> None:
+    """Write an inbox as markdown (the {role}.md layout), whatever the backend."""
+    role = args.role.lower()
+    if role not in VALID_ROLES:
+        console.print(
+            f"[red]Error:[/red] Unknown role '{role}'. Valid roles: {', '.join(VALID_ROLES)}"
+        )
+        sys.exit(1)
+
+    content = render_inbox(role, [inline_body(item) for item in get_store().load(role)])
+    if args.output:
+        Path(args.output).write_text(content)
+    else:
+        sys.stdout.write(content)
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def trace_report(records: list[dict], group: str) -> list[dict]:
+    """
+    Aggregate trace records by `group` ("cmd" or "role").
+
+    One row per group value: count, total_ms p50/p95/p99, the p95 of each
+    phase that occurs in the group (a record without a phase spent 0ms in
+    it) and the median items_scanned.
+    """
+    groups: dict[str, list[dict]] = {}
+    for record in records:
+        groups.setdefault(str(record.get(group) or "-"), []).append(record)
+
+    rows = []
+    for key, members in sorted(groups.items()):
+        totals = sorted(record.get("total_ms", 0.0) for record in members)
+        row = {
+            "group": group,
+            "key": key,
+            "n": len(members),
+            "p50_ms": percentile(totals, 0.50),
+            "p95_ms": percentile(totals, 0.95),
+            "p99_ms": percentile(totals, 0.99),
+        }
+        for phase in TRACE_PHASES:
+            field = f"{phase}_ms"
+            if any(record.get(field) is not None for record in members):
+                samples = sorted(record.get(field) or 0.0 for record in members)
+                row[f"{phase}_p95_ms"] = percentile(samples, 0.95)
+        scanned = sorted(record.get("items_scanned", 0) for record in members)
+        row["items_scanned_p50"] = percentile(scanned, 0.50)
+        rows.append(row)
+    return rows
+
+
+def cmd_trace_report(args: argparse.Namespace) -> None:
+    """Summarize a trace file: latency percentiles per subcommand and per role."""
+    import json
+
+    path = Path(args.file or TRACE_PATH or DEFAULT_TRACE_PATH)
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line from a killed process
+                if isinstance(record, dict) and (not args.since or record.get("ts", "") >= args.since):
+                    records.append(record)
+    except FileNotFoundError:
+        console.print(f"[red]Error:[/red] No trace file at {path}. Run commands with --trace first.")
+        sys.exit(1)
+
+    rows = trace_report(records, "cmd") + trace_report(records, "role")
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+        return
+    if not rows:
+        console.print(f"[yellow]No trace records in {path}.[/yellow]")
+        return
+
+    from rich.table import Table
+
+    for group, label in (("cmd", "Command"), ("role", "Role")):
+        group_rows = [row for row in rows if row["group"] == group]
+        phases = [p for p in TRACE_PHASES if any(f"{p}_p95_ms" in row for row in group_rows)]
+        table = Table(
+            title=f"By {label.lower()}: {len(records)} records, ms (phase columns are p95)",
+            title_justify="left",
+        )
+        for column in [label, "n", "p50", "p95", "p99", *phases, "items"]:
+            table.add_column(column, justify="left" if column == label else "right")
+        for row in group_rows:
+            table.add_row(
+                row["key"],
+                str(row["n"]),
+                *(f"{row[field]:.1f}" for field in ("p50_ms", "p95_ms", "p99_ms")),
+                *(f"{row.get(f'{p}_p95_ms', 0.0):.1f}" for p in phases),
+                str(row["items_scanned_p50"]),
+            )
+        console.print(table)
+
+
+def cmd_serve(args: argparse.Namespace) -> None:
+    """Run the inbox broker in the foreground until interrupted."""
+    import signal
+
+    # Treat SIGTERM like Ctrl-C so the socket file is removed on shutdown
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        InboxBroker().serve(
+            ready=lambda: console.print(f"[green]Inbox broker listening on[/green] {get_broker_path()}")
+        )
+    except InboxError as e:
+        console.print(f"[red]Error:[/red] {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        console.print("[dim]Broker stopped.[/dim]")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Inbox management for agent communication",
@@ -919,15 +3995,51 @@ Examples:
   uv run agents/tools/inbox.py wait oracle                    # Uses role default (50 min for oracle)
   uv run agents/tools/inbox.py wait engineer --from oracle    # Uses role default (3 min for engineer)
   uv run agents/tools/inbox.py wait engineer --timeout 60     # Override: explicit 60 sec
+  uv run agents/tools/inbox.py peek desk --order priority --aging 3  # HIGH first; +1 level per 3 days
+  uv run agents/tools/inbox.py take desk --from coach         # peek + claim in one step (JSON with token)
+  uv run agents/tools/inbox.py wait desk --claim              # block, then take
+  uv run agents/tools/inbox.py wait desk external --in-reply-to a3f4b2c 9e1d07f  # first reply in either
+  uv run agents/tools/inbox.py tail desk --cursor /tmp/desk.cursor  # JSONL stream, resumable
+  uv run agents/tools/inbox.py consume desk --workers 4 --exec ./handle.sh --item-timeout 300
   uv run agents/tools/inbox.py add engineer "Review code" --from oracle --priority HIGH
   uv run agents/tools/inbox.py add engineer "Fix bug" --from oracle --priority MEDIUM --body "Check line 50"
+  uv run agents/tools/inbox.py add engineer "Nightly report" --from oracle --key report-2026-01-02  # safe to retry
+  uv run agents/tools/inbox.py add-batch --file review.jsonl  # {"role", "title", "from", "priority", "body"} per line
   uv run agents/tools/inbox.py delete engineer a3f4b2c  # by ID (safer)
   uv run agents/tools/inbox.py delete engineer 1        # by index (shows warning)
   uv run agents/tools/inbox.py claim engineer a3f4b2c   # claim for exclusive work
   uv run agents/tools/inbox.py unclaim engineer a3f4b2c --token engineer-2026-01-02-003
+  uv run agents/tools/inbox.py renew engineer a3f4b2c --token engineer-2026-01-02-003  # heartbeat
+  uv run agents/tools/inbox.py compact desk --older-than 30  # archive stale unclaimed items
+  uv run agents/tools/inbox.py history desk --limit 20    # archived items as JSONL
+  uv run agents/tools/inbox.py thread a3f4b2c            # whole conversation, root first
+  uv run agents/tools/inbox.py --backend sqlite export desk  # markdown view of a SQLite inbox
+  uv run agents/tools/inbox.py serve                    # optional broker; add/peek/wait/claim/respond use it
+  INBOX_TRACE=/tmp/inbox.trace uv run agents/tools/inbox.py take desk  # or --trace-file; timings as JSONL
+  uv run agents/tools/inbox.py trace-report --file /tmp/inbox.trace  # p50/p95/p99 per command and role
         """,
     )
 
+    parser.add_argument(
+        "--durability",
+        choices=DURABILITY_MODES,
+        help="fsync policy for writes (default: $INBOX_DURABILITY or 'none')",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        help="Inbox storage (default: $INBOX_BACKEND or 'markdown')",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help=f"Append per-operation timings as JSON lines (to $INBOX_TRACE or {DEFAULT_TRACE_PATH})",
+    )
+    parser.add_argument(
+        "--trace-file",
+        metavar="PATH",
+        help="Trace to this file instead (implies --trace)",
+    )
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # read command
@@ -948,12 +4060,18 @@ Examples:
 
     # wait command
     wait_parser = subparsers.add_parser("wait", help="Block until item available or timeout")
-    wait_parser.add_argument("role", help=f"Agent role ({', '.join(VALID_ROLES)})")
+    wait_parser.add_argument(
+        "role", nargs="+", help=f"Agent role(s) to watch ({', '.join(VALID_ROLES)})"
+    )
     wait_parser.add_argument(
         "--from", dest="from_filter", help="Only wait for items from this sender role"
     )
     wait_parser.add_argument(
-        "--in-reply-to", dest="in_reply_to", help="Only wait for responses to this message ID"
+        "--in-reply-to",
+        dest="in_reply_to",
+        nargs="+",
+        action="extend",
+        help="Only wait for responses to these message IDs",
     )
     wait_parser.add_argument(
         "--timeout",
@@ -961,8 +4079,65 @@ Examples:
         default=None,
         help="Timeout in seconds (default: oracle=2999, engineer=359, others=300)",
     )
+    wait_parser.add_argument(
+        "--claim", action="store_true", help="Claim the item too (JSON includes its token)"
+    )
     wait_parser.set_defaults(func=cmd_wait)
 
+    # tail command
+    tail_parser = subparsers.add_parser(
+        "tail", help="Stream newly available items as JSON lines until interrupted"
+    )
+    tail_parser.add_argument(
+        "role", nargs="+", help=f"Agent role(s) to follow ({', '.join(VALID_ROLES)})"
+    )
+    tail_parser.add_argument(
+        "--from", dest="from_filter", help="Only stream items from this sender role"
+    )
+    tail_parser.add_argument(
+        "--in-reply-to",
+        dest="in_reply_to",
+        nargs="+",
+        action="extend",
+        help="Only stream responses to these message IDs",
+    )
+    tail_parser.add_argument(
+        "--cursor", help="Resume file: delivered items are recorded here and skipped on restart"
+    )
+    tail_parser.add_argument(
+        "--new-only",
+        dest="new_only",
+        action="store_true",
+        help="Skip items already available at start",
+    )
+    tail_parser.set_defaults(func=cmd_tail)
+
+    # take command
+    take_parser = subparsers.add_parser(
+        "take", help="Claim the next eligible item atomically (JSON with token)"
+    )
+    take_parser.add_argument("role", help=f"Agent role ({', '.join(VALID_ROLES)})")
+    take_parser.add_argument(
+        "--from", dest="from_filter", help="Only take items from this sender role"
+    )
+    take_parser.add_argument(
+        "--in-reply-to", dest="in_reply_to", help="Only take responses to this message ID"
+    )
+    take_parser.set_defaults(func=cmd_take)
+
+    for dequeue_parser in (peek_parser, wait_parser, take_parser):
+        dequeue_parser.add_argument(
+            "--order",
+            choices=DEQUEUE_ORDERS,
+            help="fifo (oldest first) or priority (HIGH > MEDIUM > LOW) (default: $INBOX_ORDER or 'fifo')",
+        )
+        dequeue_parser.add_argument(
+            "--aging",
+            type=int,
+            metavar="DAYS",
+            help="With --order priority, raise an item one level per DAYS days of age",
+        )
+
     # add command
     add_parser = subparsers.add_parser("add", help="Add item to inbox")
     add_parser.add_argument("role", help=f"Agent role ({', '.join(VALID_ROLES)})")
@@ -973,8 +4148,28 @@ Examples:
     add_parser.add_argument(
         "--body-file", dest="body_file", help="Read body from file (avoids multi-line bash)"
     )
+    add_parser.add_argument(
+        "--key", help="Idempotency key: a retry with the same key returns the original item"
+    )
+    add_parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Use a key derived from role, title, from, priority and body",
+    )
     add_parser.set_defaults(func=cmd_add)
 
+    # add-batch command
+    add_batch_parser = subparsers.add_parser(
+        "add-batch", help="Add many items from JSONL (one lock/write per inbox)"
+    )
+    add_batch_parser.add_argument(
+        "--file", help="JSONL file (default: stdin); fields: role, title, from, priority, body, key"
+    )
+    add_batch_parser.add_argument(
+        "--dedup", action="store_true", help="Derive a key from the content of lines without one"
+    )
+    add_batch_parser.set_defaults(func=cmd_add_batch)
+
     # delete command
     delete_parser = subparsers.add_parser("delete", help="Delete item from inbox")
     delete_parser.add_argument("role", help=f"Agent role ({', '.join(VALID_ROLES)})")
@@ -990,6 +4185,13 @@ Examples:
     claim_parser.add_argument("item_id", help="Item ID (7-char hex)")
     claim_parser.set_defaults(func=cmd_claim)
 
+    # renew command
+    renew_parser = subparsers.add_parser("renew", help="Extend a claim's lease (heartbeat)")
+    renew_parser.add_argument("role", help=f"Agent role ({', '.join(VALID_ROLES)})")
+    renew_parser.add_argument("item_id", help="Item ID (7-char hex)")
+    renew_parser.add_argument("--token", required=True, help="Session token from claim")
+    renew_parser.set_defaults(func=cmd_renew)
+
     # unclaim command
     unclaim_parser = subparsers.add_parser("unclaim", help="Unclaim item (requires token)")
     unclaim_parser.add_argument("role", help=f"Agent role ({', '.join(VALID_ROLES)})")
@@ -1018,8 +4220,152 @@ Examples:
     )
     unclaim_stale_parser.set_defaults(func=cmd_unclaim_stale)
 
+    # compact command
+    compact_parser = subparsers.add_parser(
+        "compact", help="Archive old unclaimed items and trim the hot inbox"
+    )
+    compact_parser.add_argument("role", help=f"Agent role ({', '.join(VALID_ROLES)})")
+    compact_parser.add_argument(
+        "--older-than",
+        dest="older_than",
+        type=int,
+        default=30,
+        help="Archive unclaimed items dated more than this many days ago (default: 30)",
+    )
+    compact_parser.set_defaults(func=cmd_compact)
+
+    # history command
+    history_parser = subparsers.add_parser("history", help="Archived items as JSON lines")
+    history_parser.add_argument("role", help=f"Agent role ({', '.join(VALID_ROLES)})")
+    history_parser.add_argument("--month", help="Only this archive month (YYYY-MM)")
+    history_parser.add_argument("--id", dest="item_id", help="Only the item with this ID")
+    history_parser.add_argument("--from", dest="from_filter", help="Only items from this sender role")
+    history_parser.add_argument("--limit", type=int, help="Only the most recent N items")
+    history_parser.set_defaults(func=cmd_history)
+
+    # thread command
+    thread_parser = subparsers.add_parser(
+        "thread", help="A conversation (In-Reply-To chain) across inboxes and archive, as JSONL"
+    )
+    thread_parser.add_argument("item_id", help="Any item ID in the conversation")
+    thread_parser.set_defaults(func=cmd_thread)
+
+    # consume command
+    consume_parser = subparsers.add_parser(
+        "consume", help="Process items with a pool of handler commands"
+    )
+    consume_parser.add_argument("role", help=f"Agent role ({', '.join(VALID_ROLES)})")
+    consume_parser.add_argument(
+        "--exec",
+        dest="exec_command",
+        required=True,
+        help="Shell command run per item: item JSON on stdin, stdout becomes the response",
+    )
+    consume_parser.add_argument("--workers", type=int, default=1, help="Concurrent handlers (default: 1)")
+    consume_parser.add_argument(
+        "--item-timeout",
+        dest="item_timeout",
+        type=float,
+        help="Seconds before a handler is killed (item stays claimed)",
+    )
+    consume_parser.add_argument(
+        "--from", dest="from_filter", help="Only take items from this sender role"
+    )
+    consume_parser.add_argument(
+        "--order", choices=DEQUEUE_ORDERS, help="Dequeue order (default: $INBOX_ORDER or 'fifo')"
+    )
+    consume_parser.add_argument(
+        "--aging", type=int, metavar="DAYS", help="Priority aging (see peek --aging)"
+    )
+    consume_parser.add_argument(
+        "--max-items", dest="max_items", type=int, help="Stop after taking this many items"
+    )
+    consume_parser.add_argument(
+        "--idle-exit",
+        dest="idle_exit",
+        type=float,
+        help="Stop once the inbox has been empty this many seconds (default: run until Ctrl-C)",
+    )
+    consume_parser.add_argument(
+        "--json", action="store_true", help="Print the exit summary as one JSON object"
+    )
+    consume_parser.set_defaults(func=cmd_consume)
+
+    for lease_parser in (claim_parser, renew_parser, take_parser, wait_parser, consume_parser):
+        lease_parser.add_argument(
+            "--lease",
+            type=int,
+            metavar="SECONDS",
+            help="Claim lease; expired claims become available again "
+            + (
+                "(default: never expires)"
+                if lease_parser is claim_parser
+                else "(default: $INBOX_LEASE or 3600; 0 = never expires)"
+            ),
+        )
+
+    # export command
+    export_parser = subparsers.add_parser("export", help="Render an inbox as markdown")
+    export_parser.add_argument("role", help=f"Agent role ({', '.join(VALID_ROLES)})")
+    export_parser.add_argument("--output", "-o", help="Write to this file instead of stdout")
+    export_parser.set_defaults(func=cmd_export)
+
+    # serve command
+    serve_parser = subparsers.add_parser(
+        "serve", help="Run the optional inbox broker (clients fall back to files without it)"
+    )
+    serve_parser.set_defaults(func=cmd_serve)
+
+    # trace-report command
+    trace_report_parser = subparsers.add_parser(
+        "trace-report", help="Latency percentiles per command and role from a trace file"
+    )
+    trace_report_parser.add_argument(
+        "--file", help=f"Trace file (default: $INBOX_TRACE or {DEFAULT_TRACE_PATH})"
+    )
+    trace_report_parser.add_argument("--since", help="Only records at or after this ISO timestamp")
+    trace_report_parser.add_argument("--json", action="store_true", help="JSON lines, one per row")
+    trace_report_parser.set_defaults(func=cmd_trace_report)
+
     args = parser.parse_args()
-    args.func(args)
+
+    global BACKEND, DURABILITY, TRACE_PATH
+    if args.backend:
+        BACKEND = args.backend
+    if BACKEND not in BACKENDS:
+        console.print(
+            f"[red]Error:[/red] Invalid INBOX_BACKEND '{BACKEND}'. Use: {', '.join(BACKENDS)}"
+        )
+        sys.exit(1)
+    if DEQUEUE_ORDER not in DEQUEUE_ORDERS:
+        console.print(
+            f"[red]Error:[/red] Invalid INBOX_ORDER '{DEQUEUE_ORDER}'. Use: {', '.join(DEQUEUE_ORDERS)}"
+        )
+        sys.exit(1)
+    if args.durability:
+        DURABILITY = args.durability
+    if DURABILITY not in DURABILITY_MODES:
+        console.print(
+            f"[red]Error:[/red] Invalid INBOX_DURABILITY '{DURABILITY}'. Use: {', '.join(DURABILITY_MODES)}"
+        )
+        sys.exit(1)
+    if args.trace or args.trace_file:
+        TRACE_PATH = args.trace_file or TRACE_PATH or str(DEFAULT_TRACE_PATH)
+
+    if args.command == "trace-report":
+        args.func(args)
+        return
+    role = getattr(args, "role", None)
+    trace_begin(args.command, ",".join(role) if isinstance(role, list) else role, startup=True)
+    try:
+        args.func(args)
+    except SystemExit as e:
+        trace_end(exit_code=e.code if isinstance(e.code, int) else int(e.code is not None))
+        raise
+    except BaseException:
+        trace_end(exit_code=1)
+        raise
+    trace_end(exit_code=0)
 
 
 if __name__ == "__main__":
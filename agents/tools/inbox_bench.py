@@ -0,0 +1,906 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.12"
+# dependencies = ["rich>=13.0.0", "filelock>=3.12.0"]
+# ///
+"""
+Benchmarks for the inbox engine (agents/tools/inbox.py).
+
+Runs against a scratch directory, never the real agents/state/inboxes/.
+
+Usage:
+    uv run agents/tools/inbox_bench.py add                 # add latency vs inbox size
+    uv run agents/tools/inbox_bench.py add --sizes 0 1000 5000 --repeat 50
+    uv run agents/tools/inbox_bench.py add --json          # machine-readable rows
+    uv run agents/tools/inbox_bench.py load                # cold parse vs per-process memo
+    uv run agents/tools/inbox_bench.py startup             # cold CLI latency per subcommand
+    uv run agents/tools/inbox_bench.py parse               # single-pass vs legacy regex parser
+    uv run agents/tools/inbox_bench.py durability          # write cost per fsync mode
+    uv run agents/tools/inbox_bench.py backends            # markdown vs sqlite under contention
+    uv run agents/tools/inbox_bench.py contention --producers 4 --consumers 4  # loss/dup check
+    uv run agents/tools/inbox_bench.py --json suite > before.jsonl  # engine paths x sizes x bodies
+    uv run agents/tools/inbox_bench.py compare before.jsonl after.jsonl  # p50 ratios run over run
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import inbox  # noqa: E402
+from filelock import FileLock  # noqa: E402
+
+
+@contextmanager
+def scratch_dir():
+    """Run inside a temporary directory so inbox.INBOX_DIR resolves there."""
+    old_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="inbox-bench-") as tmp:
+        os.chdir(tmp)
+        try:
+            yield Path(tmp)
+        finally:
+            os.chdir(old_cwd)
+
+
+def make_item(n: int, body_size: int = 200) -> dict:
+    """Build a synthetic unclaimed item with a deterministic ID."""
+    title = f"Synthetic item {n}"
+    return {
+        "id": inbox.generate_item_id(title, "desk", "2026-01-01", "MEDIUM"),
+        "title": title,
+        "from": "desk:bench",
+        "date": "2026-01-01",
+        "priority": "MEDIUM",
+        "body": ("lorem ipsum " * (body_size // 12 + 1))[:body_size],
+    }
+
+
+# Item fields produced by legacy_parse_inbox, in its order
+LEGACY_FIELDS = ("id", "title", "from", "date", "priority", "in_reply_to", "status", "claimed_at", "body")
+
+
+def legacy_parse_inbox(content: str) -> list[dict]:
+    """The multi-regex parser inbox.py used before the single-pass parse_block (baseline only)."""
+    from datetime import date
+
+    items = []
+    for part in re.split(r"\n---\n", content):
+        part = part.strip()
+        if part.startswith("# "):
+            lines = part.split("\n", 1)
+            part = lines[1].strip() if len(lines) > 1 else ""
+        if not part or (part.startswith("<!--") and part.endswith("-->")):
+            continue
+
+        title_match = re.search(r"^## (.+)$", part, re.MULTILINE)
+        id_match = re.search(r"\*\*ID:\*\*\s*([a-f0-9]{7})(?:\n|$)", part)
+        from_match = re.search(r"\*\*From:\*\*\s*(.+?)(?:\n|$)", part)
+        date_match = re.search(r"\*\*Date:\*\*\s*(.+?)(?:\n|$)", part)
+        priority_match = re.search(r"\*\*Priority:\*\*\s*(.+?)(?:\n|$)", part)
+        in_reply_to_match = re.search(r"\*\*In-Reply-To:\*\*\s*([a-f0-9]{7})(?:\n|$)", part)
+        status_match = re.search(r"\*\*Status:\*\*\s*CLAIMED by (.+?)(?:\n|$)", part)
+        claimed_at_match = re.search(r"\*\*Claimed At:\*\*\s*(.+?)(?:\n|$)", part)
+
+        title = title_match.group(1) if title_match else "Untitled"
+        from_agent = from_match.group(1).strip() if from_match else "Unknown"
+        date_str = date_match.group(1).strip() if date_match else str(date.today())
+        priority = priority_match.group(1).strip() if priority_match else "MEDIUM"
+        in_reply_to = in_reply_to_match.group(1).strip() if in_reply_to_match else None
+        status = status_match.group(1).strip() if status_match else None
+        claimed_at = claimed_at_match.group(1).strip() if claimed_at_match else None
+        item_id = (
+            id_match.group(1)
+            if id_match
+            else inbox.generate_item_id(title, from_agent, date_str, priority)
+        )
+
+        if claimed_at:
+            body_match = re.search(r"\*\*Claimed At:\*\*[^\n]*\n(.+)", part, re.DOTALL)
+        elif status:
+            body_match = re.search(r"\*\*Status:\*\*[^\n]*\n(.+)", part, re.DOTALL)
+        elif in_reply_to:
+            body_match = re.search(r"\*\*In-Reply-To:\*\*[^\n]*\n(.+)", part, re.DOTALL)
+        else:
+            body_match = re.search(r"\*\*Priority:\*\*[^\n]*\n(.+)", part, re.DOTALL)
+        body = inbox.unescape_body_separators(body_match.group(1).strip() if body_match else "")
+
+        items.append(
+            {
+                "id": item_id,
+                "title": title,
+                "from": from_agent,
+                "date": date_str,
+                "priority": priority,
+                "in_reply_to": in_reply_to,
+                "status": status,
+                "claimed_at": claimed_at,
+                "body": body,
+            }
+        )
+    return items
+
+
+def summarize(samples: list[float]) -> dict:
+    """Reduce raw timings (seconds) to millisecond statistics."""
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 4),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 4),
+    }
+
+
+def bench_add(args: argparse.Namespace) -> list[dict]:
+    """Time one locked enqueue at each inbox size: append-only vs parse-and-rewrite."""
+    role = "desk"
+    rows = []
+    with scratch_dir():
+        inbox_path = inbox.get_inbox_path(role)
+        lock_path = inbox_path.with_suffix(".lock")
+
+        def add_append(item: dict) -> None:
+            with FileLock(lock_path, timeout=inbox.LOCK_TIMEOUT):
+                inbox.append_inbox_item(role, item)
+
+        def add_rewrite(item: dict) -> None:
+            with FileLock(lock_path, timeout=inbox.LOCK_TIMEOUT):
+                items = inbox.parse_inbox(inbox_path.read_text()) if inbox_path.exists() else []
+                items.append(item)
+                inbox.write_inbox(role, items)
+
+        for variant, add in (("append", add_append), ("rewrite", add_rewrite)):
+            for size in args.sizes:
+                samples = []
+                for r in range(args.repeat):
+                    # Reset to exactly `size` items so every sample sees the same inbox
+                    inbox.write_inbox(role, [make_item(i) for i in range(size)])
+                    inbox.load_inbox(role)  # As in normal use, a reader has been here first
+                    item = make_item(size + r)
+                    start = time.perf_counter()
+                    add(item)
+                    samples.append(time.perf_counter() - start)
+                rows.append({"bench": "add", "variant": variant, "items": size, **summarize(samples)})
+    return rows
+
+
+def bench_load(args: argparse.Namespace) -> list[dict]:
+    """Time reading an unchanged inbox: cold read + parse vs the per-process memo."""
+    role = "desk"
+    rows = []
+    with scratch_dir():
+        for size in args.sizes:
+            inbox.write_inbox(role, [make_item(i) for i in range(size)])
+
+            variants = (
+                # What every CLI invocation pays
+                ("parse", lambda: inbox._loaded.clear() or inbox.load_inbox(role)),
+                # Repeat reads in one process (the broker): a stat() and copies
+                ("memo", lambda: inbox.load_inbox(role)),
+            )
+            for variant, load in variants:
+                samples = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    load()
+                    samples.append(time.perf_counter() - start)
+                rows.append({"bench": "load", "variant": variant, "items": size, **summarize(samples)})
+    return rows
+
+
+def bench_startup(args: argparse.Namespace) -> list[dict]:
+    """
+    Time cold `inbox.py` invocations (fresh interpreter) per subcommand.
+
+    Direct file mode only (INBOX_BROKER=off). Each sample starts from the
+    same small inbox; claim/respond get a fresh claimable item per sample.
+    """
+    role = "desk"
+    script = str(Path(inbox.__file__).resolve())
+    env = {**os.environ, "INBOX_BROKER": "off"}
+    rows = []
+    with scratch_dir() as tmp:
+        batch_file = tmp / "batch.jsonl"
+        batch_file.write_text(
+            "\n".join(
+                json.dumps({"role": role, "title": f"Batch {n}", "from": "coach:bench"})
+                for n in range(10)
+            )
+        )
+
+        def prepare() -> dict:
+            """Reset the inbox and return IDs/tokens the commands need."""
+            items = [make_item(i) for i in range(args.items)]
+            inbox.write_inbox(role, items)
+            claimed = inbox.claim_item(role, items[1]["id"])
+            return {"claim_id": items[0]["id"], "respond_id": claimed["id"], "token": claimed["status"]}
+
+        commands = {
+            "read": lambda ctx: ["read", role],
+            "peek": lambda ctx: ["peek", role],
+            "wait": lambda ctx: ["wait", role, "--timeout", "0"],
+            "add": lambda ctx: ["add", role, "Startup", "--from", "coach:bench", "--body", "x"],
+            "add-batch": lambda ctx: ["add-batch", "--file", str(batch_file)],
+            "claim": lambda ctx: ["claim", role, ctx["claim_id"]],
+            "respond": lambda ctx: ["respond", role, ctx["respond_id"], "--token", ctx["token"], "--body", "ok"],
+            "unclaim_stale": lambda ctx: ["unclaim_stale", role, "--older-than", "3600"],
+        }
+        for name in args.commands or commands:
+            samples = []
+            for _ in range(args.repeat):
+                argv = [sys.executable, script, *commands[name](prepare())]
+                start = time.perf_counter()
+                subprocess.run(argv, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, check=True)
+                samples.append(time.perf_counter() - start)
+            rows.append({"bench": "startup", "variant": name, "items": args.items, **summarize(samples)})
+    return rows
+
+
+def bench_parse(args: argparse.Namespace) -> list[dict]:
+    """Time parsing in-memory inbox text: single-pass parse_inbox vs the legacy regex parser."""
+    rows = []
+    for size in args.sizes:
+        items = [make_item(i) for i in range(size)]
+        content = inbox.inbox_header("desk") + "".join(
+            inbox.format_item(item) + "\n\n---\n\n" for item in items
+        )
+        # Compare only the fields the legacy parser knew; newer ones (lease_until) are extra
+        current = [{field: item.get(field) for field in LEGACY_FIELDS} for item in inbox.parse_inbox(content)]
+        if current != legacy_parse_inbox(content):
+            raise SystemExit(f"Parsers disagree on the {size}-item inbox")
+
+        for variant, parse in (("single-pass", inbox.parse_inbox), ("legacy", legacy_parse_inbox)):
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                parse(content)
+                samples.append(time.perf_counter() - start)
+            rows.append({"bench": "parse", "variant": variant, "items": size, **summarize(samples)})
+    return rows
+
+
+def bench_durability(args: argparse.Namespace) -> list[dict]:
+    """
+    Time writes under each durability mode.
+
+    rewrite: write_inbox of the whole inbox; append: one locked enqueue;
+    batch: add_batch of --batch items spread over every role (group commit).
+    """
+    role = "desk"
+    rows = []
+    saved_mode = inbox.DURABILITY
+    with scratch_dir():
+        items = [make_item(i) for i in range(args.items)]
+        batch = [
+            {**make_item(n), "role": inbox.VALID_ROLES[n % len(inbox.VALID_ROLES)]}
+            for n in range(args.batch)
+        ]
+        operations = {
+            "rewrite": lambda: inbox.write_inbox(role, items),
+            "append": lambda: inbox.add_item(role, "Durable", "coach:bench", "MEDIUM", "x"),
+            "batch": lambda: inbox.add_batch(batch),
+        }
+        try:
+            for mode in inbox.DURABILITY_MODES:
+                inbox.DURABILITY = mode
+                for operation, run in operations.items():
+                    samples = []
+                    for _ in range(args.repeat):
+                        inbox.write_inbox(role, items)
+                        start = time.perf_counter()
+                        run()
+                        samples.append(time.perf_counter() - start)
+                    rows.append(
+                        {
+                            "bench": "durability",
+                            "variant": f"{mode}:{operation}",
+                            "items": args.items,
+                            **summarize(samples),
+                        }
+                    )
+        finally:
+            inbox.DURABILITY = saved_mode
+    return rows
+
+
+def backend_producer(backend: str, role: str, count: int) -> None:
+    inbox.BACKEND = backend
+    inbox._stores.clear()  # Never share a store (or SQLite connection) across fork
+    for n in range(count):
+        inbox.add_item(role, f"Load {os.getpid()}-{n}", "coach:bench", "MEDIUM", "x" * 200)
+
+
+def backend_consumer(backend: str, role: str, total: int, consumed, latencies) -> None:
+    """Peek, claim and delete until `total` items have been consumed by all workers."""
+    inbox.BACKEND = backend
+    inbox._stores.clear()
+    store = inbox.get_store()
+    samples = []
+    while consumed.value < total:
+        start = time.perf_counter()
+        item = inbox.select_item(store.load(role), None, None)
+        if not item:
+            time.sleep(0.001)
+            continue
+        try:
+            inbox.claim_item(role, item["id"])
+        except inbox.InboxError:
+            continue  # Another consumer won the race
+        with store.lock(role):
+            items = store.load(role)
+            index = inbox.find_item_index(items, item["id"])
+            if index is not None:
+                removed = items.pop(index)
+                store.save(role, items, removed=[removed])
+        with consumed.get_lock():
+            consumed.value += 1
+        samples.append(time.perf_counter() - start)
+    latencies.put(samples)
+
+
+def bench_backends(args: argparse.Namespace) -> list[dict]:
+    """
+    Producer/consumer throughput per storage backend.
+
+    --producers processes each add --items items to one inbox while
+    --consumers processes peek, claim and delete them. Latency is per
+    consumed item; ops/s is items consumed per second of wall time.
+    """
+    import multiprocessing
+
+    role = "desk"
+    total = args.producers * args.items
+    rows = []
+    for backend in args.backends:
+        with scratch_dir():
+            consumed = multiprocessing.Value("i", 0)
+            latencies = multiprocessing.Queue()
+            workers = [
+                multiprocessing.Process(target=backend_producer, args=(backend, role, args.items))
+                for _ in range(args.producers)
+            ] + [
+                multiprocessing.Process(
+                    target=backend_consumer, args=(backend, role, total, consumed, latencies)
+                )
+                for _ in range(args.consumers)
+            ]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            samples = []
+            for _ in range(args.consumers):
+                samples.extend(latencies.get())
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+        rows.append(
+            {
+                "bench": "backends",
+                "variant": f"{backend}:{args.producers}p{args.consumers}c",
+                "items": total,
+                **summarize(samples),
+                "ops_s": round(total / elapsed, 1),
+            }
+        )
+    return rows
+
+
+def is_lock_timeout(exc: BaseException) -> bool:
+    """True for a backend's lock-acquisition timeout (filelock or SQLite busy)."""
+    import sqlite3
+
+    from filelock import Timeout
+
+    if isinstance(exc, Timeout):
+        return True
+    return isinstance(exc, sqlite3.OperationalError) and "locked" in str(exc)
+
+
+def contention_producer(
+    backend: str, role: str, producer: int, count: int, rate: float, lock_timeout: float, stats
+) -> None:
+    """Add `count` messages whose bodies carry (producer, seq, sent) for later verification."""
+    inbox.BACKEND = backend
+    inbox.LOCK_TIMEOUT = lock_timeout
+    inbox._stores.clear()  # Never share a store (or SQLite connection) across fork
+    timeouts = 0
+    for seq in range(count):
+        body = json.dumps({"producer": producer, "seq": seq, "sent": time.time()})
+        while True:
+            try:
+                inbox.add_item(role, f"Load {producer}-{seq}", f"coach:load-{producer}", "MEDIUM", body)
+                break
+            except Exception as e:
+                if not is_lock_timeout(e):
+                    raise
+                timeouts += 1  # Retry: an add that timed out on the lock was never applied
+        if rate:
+            time.sleep(1 / rate)
+    stats.put({"producer": producer, "lock_timeouts": timeouts})
+
+
+def contention_consumer(
+    backend: str, role: str, mode: str, lock_timeout: float, producers_done, stats
+) -> None:
+    """
+    Take (or select + claim) and respond until the producers are done and
+    the inbox has nothing left; report what was received.
+    """
+    inbox.BACKEND = backend
+    inbox.LOCK_TIMEOUT = lock_timeout
+    inbox._stores.clear()
+    store = inbox.get_store()
+    received, latencies = [], []
+    timeouts = races = 0
+    while True:
+        finished = producers_done.is_set()  # Read before looking, so a final empty look is conclusive
+        try:
+            if mode == "take":
+                item = inbox.take_item(role) or None
+                token = item["token"] if item else None
+            else:
+                item = inbox.select_item(store.load(role))
+                if item:
+                    token = inbox.claim_item(role, item["id"])["status"]
+        except inbox.InboxError:
+            races += 1  # Lost a claim race (claim mode) or a maildir conflict
+            continue
+        except Exception as e:
+            if not is_lock_timeout(e):
+                raise
+            timeouts += 1
+            continue
+        if not item:
+            if finished:
+                break
+            time.sleep(0.002)
+            continue
+
+        payload = json.loads(item["body"])
+        latencies.append(time.time() - payload["sent"])
+        received.append((payload["producer"], payload["seq"]))
+        while True:
+            try:
+                inbox.respond_item(role, item["id"], token, f"ack {payload['producer']}-{payload['seq']}")
+                break
+            except inbox.InboxConflict:
+                races += 1  # Maildir: the message moved under us; reload and retry
+                continue
+            except inbox.InboxError:
+                races += 1  # Lost the claim; verification reports the missing ack
+                break
+            except Exception as e:
+                if not is_lock_timeout(e):
+                    raise
+                timeouts += 1
+    stats.put({"received": received, "latencies": latencies, "lock_timeouts": timeouts, "races": races})
+
+
+def bench_contention(args: argparse.Namespace) -> list[dict]:
+    """
+    Several agent processes hammering one inbox, with end-to-end verification.
+
+    --producers processes each add --items messages to desk while
+    --consumers processes take them (or select + claim with --mode claim,
+    the peek-then-claim pattern) and respond, which archives the original
+    and delivers an ack to coach. Latency is enqueue to take, across
+    processes. Afterwards every (producer, seq) must have been received
+    exactly once, desk must be empty and coach must hold one ack per
+    message; any loss or duplicate, or a worker that died, exits non-zero.
+    Lock timeouts (filelock Timeout, SQLite busy) are counted and retried.
+    """
+    import multiprocessing
+    import queue
+    from collections import Counter
+
+    role = "desk"
+    total = args.producers * args.items
+    rows = []
+    failed = False
+    for backend in args.backends:
+        with scratch_dir():
+            producers_done = multiprocessing.Event()
+            stats = multiprocessing.Queue()
+            producers = [
+                multiprocessing.Process(
+                    target=contention_producer,
+                    args=(backend, role, p, args.items, args.rate, args.lock_timeout, stats),
+                )
+                for p in range(args.producers)
+            ]
+            consumers = [
+                multiprocessing.Process(
+                    target=contention_consumer,
+                    args=(backend, role, args.mode, args.lock_timeout, producers_done, stats),
+                )
+                for _ in range(args.consumers)
+            ]
+            start = time.perf_counter()
+            for worker in producers + consumers:
+                worker.start()
+            for worker in producers:
+                worker.join()
+            producers_done.set()
+            workers = producers + consumers
+            reports = []
+            while len(reports) < len(workers):
+                try:
+                    reports.append(stats.get(timeout=1))
+                except queue.Empty:
+                    if all(worker.exitcode is not None for worker in workers):
+                        break  # Some worker died without reporting
+            for worker in consumers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            died = sum(1 for worker in workers if worker.exitcode != 0)
+
+            inbox.BACKEND = backend
+            inbox._stores.clear()
+            inbox._loaded.clear()
+            left = len(inbox.get_store().load(role))
+            acks = sum(1 for item in inbox.get_store().load("coach") if item.get("in_reply_to"))
+            inbox._stores.clear()
+
+        received = Counter(pair for report in reports for pair in report.get("received", ()))
+        expected = {(p, n) for p in range(args.producers) for n in range(args.items)}
+        lost = len(expected - set(received))
+        duplicated = sum(count - 1 for count in received.values() if count > 1)
+        latencies = [sample for report in reports for sample in report.get("latencies", ())]
+        row = {
+            "bench": "contention",
+            "variant": f"{backend}:{args.mode}:{args.producers}p{args.consumers}c",
+            "items": total,
+            **summarize(latencies or [0.0]),
+            "ops_s": round(sum(received.values()) / elapsed, 1),
+            "lost": lost,
+            "duplicated": duplicated,
+            "left_in_inbox": left,
+            "acks": acks,
+            "lock_timeouts": sum(report["lock_timeouts"] for report in reports),
+            "races": sum(report.get("races", 0) for report in reports),
+            "workers_died": died,
+        }
+        rows.append(row)
+        ok = not lost and not duplicated and not left and acks == total and not died
+        failed = failed or not ok
+        if not args.json:
+            print(
+                f"{row['variant']}: {'OK' if ok else 'FAILED'} - lost {lost}, duplicated {duplicated}, "
+                f"left {left}, acks {acks}/{total}, workers died {died}, lock timeouts {row['lock_timeouts']}, "
+                f"claim races {row['races']}, p99 {row['p99_ms']:.1f} ms",
+                file=sys.stderr,
+            )
+    if failed:
+        print_rows(rows, args.json)
+        sys.exit(1)
+    return rows
+
+
+SUITE_OPS = ["parse", "format", "write", "add", "peek", "claim", "respond", "unclaim_stale"]
+
+
+def suite_items(size: int, body_size: int, claimed_pct: int) -> list[dict]:
+    """
+    Synthetic inbox for the suite: `claimed_pct` percent of the items, spread
+    evenly, are claimed (two hours ago, lease still running).
+    """
+    from datetime import datetime, timedelta, timezone
+
+    claimed_at = (datetime.now(timezone.utc) - timedelta(hours=2)).isoformat()
+    lease_until = inbox.lease_deadline(86400)
+    items = []
+    for n in range(size):
+        item = make_item(n, body_size)
+        item["from"] = "coach:bench"  # A valid sender, so respond has somewhere to deliver
+        if (n + 1) * claimed_pct // 100 > n * claimed_pct // 100:
+            item.update(status=f"desk-bench-{n}", claimed_at=claimed_at, lease_until=lease_until)
+        items.append(item)
+    return items
+
+
+def suite_reset(role: str, backend: str, items: list[dict]) -> None:
+    """
+    Replace the scratch inbox with `items` as a fresh CLI process would find it:
+    data on disk, nothing memoized in this process.
+    """
+    shutil.rmtree(inbox.INBOX_DIR, ignore_errors=True)
+    inbox.INBOX_DIR.mkdir(parents=True)
+    inbox._stores.clear()
+    inbox._loaded.clear()
+    if backend == "markdown":
+        inbox.write_inbox(role, items)
+    else:
+        store = inbox.get_store()
+        with store.lock(role):
+            store.append(role, items)
+    inbox._stores.clear()
+    inbox._loaded.clear()
+
+
+def suite_op(op: str, role: str, items: list[dict]):
+    """Return a zero-argument callable performing one `op` against the seeded inbox."""
+    import contextlib
+    import io
+
+    unclaimed = next((item for item in items if not item.get("status")), None)
+    claimed = next((item for item in items if item.get("status")), None)
+    if op == "add":
+        return lambda: inbox.add_item(role, "Suite add", "coach:bench", "MEDIUM", items[0]["body"])
+    if op == "peek":
+        return lambda: inbox.peek_item(role)
+    if op == "claim":
+        if unclaimed is None:
+            return None
+        return lambda: inbox.claim_item(role, unclaimed["id"])
+    if op == "respond":
+        if claimed is None:
+            return None
+        return lambda: inbox.respond_item(role, claimed["id"], claimed["status"], "Suite response")
+    if op == "unclaim_stale":
+        args = argparse.Namespace(role=role, older_than=3600)
+
+        def unclaim_stale() -> None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                inbox.cmd_unclaim_stale(args)
+
+        return unclaim_stale
+    raise ValueError(op)
+
+
+def bench_suite(args: argparse.Namespace) -> list[dict]:
+    """
+    The engine's hot paths across inbox sizes, body sizes and a claimed mix.
+
+    parse, format and write time parse_inbox, render_inbox (format_item per
+    item) and write_inbox on the whole inbox; they are the markdown format's
+    costs and are labelled markdown whatever --backend says. add, peek, claim, respond and
+    unclaim_stale each run against a freshly seeded inbox per sample, on
+    --backend, so every sample sees the same state. Combinations larger
+    than --max-mb of body text are skipped (100k x 4KB is ~400MB).
+    """
+    role = "desk"
+    rows = []
+    saved_backend = inbox.BACKEND
+    inbox.BACKEND = args.backend
+    try:
+        with scratch_dir():
+            for size in args.sizes:
+                for body_size in args.bodies:
+                    if size * body_size > args.max_mb * 1024 * 1024:
+                        print(
+                            f"skipping {size} items x {body_size}B (over --max-mb {args.max_mb})",
+                            file=sys.stderr,
+                        )
+                        continue
+                    items = suite_items(size, body_size, args.claimed)
+                    content = inbox.render_inbox(role, items)
+                    for op in args.ops:
+                        backend = args.backend
+                        if op in ("parse", "format", "write"):
+                            backend = "markdown"
+                            run = {
+                                "parse": lambda: inbox.parse_inbox(content),
+                                "format": lambda: inbox.render_inbox(role, items),
+                                "write": lambda: inbox.write_inbox(role, items),
+                            }[op]
+                            reset = None
+                        else:
+                            run = suite_op(op, role, items)
+                            reset = lambda: suite_reset(role, args.backend, items)
+                        if run is None:
+                            continue  # respond with nothing claimed, claim with nothing free
+                        samples = []
+                        for _ in range(args.repeat):
+                            if reset:
+                                reset()
+                            start = time.perf_counter()
+                            run()
+                            samples.append(time.perf_counter() - start)
+                        rows.append(
+                            {
+                                "bench": "suite",
+                                "variant": f"{op}:{backend}:{body_size}B",
+                                "items": size,
+                                **summarize(samples),
+                                "op": op,
+                                "backend": backend,
+                                "body_bytes": body_size,
+                                "claimed_pct": args.claimed,
+                            }
+                        )
+    finally:
+        inbox.BACKEND = saved_backend
+        inbox._stores.clear()
+    return rows
+
+
+def read_rows(path: str) -> dict[tuple, dict]:
+    """Rows from a `--json` run, keyed by (bench, variant, items)."""
+    rows = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                row = json.loads(line)
+                rows[(row["bench"], row["variant"], row["items"])] = row
+    return rows
+
+
+def bench_compare(args: argparse.Namespace) -> None:
+    """Print p50 ratios (new/old) for rows present in both --json runs."""
+    old, new = read_rows(args.old), read_rows(args.new)
+    shared = [key for key in old if key in new]
+    if args.json:
+        for key in shared:
+            ratio = new[key]["p50_ms"] / old[key]["p50_ms"] if old[key]["p50_ms"] else None
+            print(
+                json.dumps(
+                    {
+                        "bench": key[0],
+                        "variant": key[1],
+                        "items": key[2],
+                        "old_p50_ms": old[key]["p50_ms"],
+                        "new_p50_ms": new[key]["p50_ms"],
+                        "ratio": round(ratio, 3) if ratio is not None else None,
+                    }
+                )
+            )
+        return
+    print(f"{'bench':<10} {'variant':<30} {'items':>8} {'old p50':>10} {'new p50':>10} {'ratio':>7}")
+    regressions = 0
+    for key in shared:
+        old_p50, new_p50 = old[key]["p50_ms"], new[key]["p50_ms"]
+        ratio = new_p50 / old_p50 if old_p50 else float("inf")
+        flag = ""
+        if ratio > args.threshold:
+            flag = "  slower"
+            regressions += 1
+        elif ratio < 1 / args.threshold:
+            flag = "  faster"
+        print(
+            f"{key[0]:<10} {key[1]:<30} {key[2]:>8} {old_p50:>10.3f} {new_p50:>10.3f} {ratio:>7.2f}{flag}"
+        )
+    only = len(old) + len(new) - 2 * len(shared)
+    if only:
+        print(f"({only} row(s) present in only one run)")
+    if regressions:
+        sys.exit(1)
+
+
+def print_rows(rows: list[dict], as_json: bool) -> None:
+    if as_json:
+        for row in rows:
+            print(json.dumps(row))
+        return
+    print(
+        f"{'bench':<10} {'variant':<30} {'items':>8} {'n':>5} {'mean ms':>10} {'p50 ms':>10} "
+        f"{'p95 ms':>10} {'ops/s':>10}"
+    )
+    for row in rows:
+        print(
+            f"{row['bench']:<10} {row['variant']:<30} {row['items']:>8} {row['n']:>5} "
+            f"{row['mean_ms']:>10.3f} {row['p50_ms']:>10.3f} {row['p95_ms']:>10.3f} "
+            f"{row.get('ops_s', ''):>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inbox engine benchmarks")
+    parser.add_argument("--json", action="store_true", help="Emit one JSON object per result row")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="Add latency as the inbox grows")
+    add_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[0, 100, 1000, 5000], help="Inbox sizes (items)"
+    )
+    add_parser.add_argument("--repeat", type=int, default=20, help="Samples per size")
+    add_parser.set_defaults(func=bench_add)
+
+    load_parser = subparsers.add_parser("load", help="Read latency for an unchanged inbox")
+    load_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 1000, 10000], help="Inbox sizes (items)"
+    )
+    load_parser.add_argument("--repeat", type=int, default=20, help="Samples per size")
+    load_parser.set_defaults(func=bench_load)
+
+    startup_parser = subparsers.add_parser("startup", help="Cold CLI latency per subcommand")
+    startup_parser.add_argument("--commands", nargs="+", help="Subcommands to time (default: all)")
+    startup_parser.add_argument("--items", type=int, default=20, help="Items in the inbox")
+    startup_parser.add_argument("--repeat", type=int, default=10, help="Samples per subcommand")
+    startup_parser.set_defaults(func=bench_startup)
+
+    parse_parser = subparsers.add_parser("parse", help="Parser throughput vs the legacy parser")
+    parse_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 10000, 100000], help="Inbox sizes (items)"
+    )
+    parse_parser.add_argument("--repeat", type=int, default=3, help="Samples per size")
+    parse_parser.set_defaults(func=bench_parse)
+
+    durability_parser = subparsers.add_parser("durability", help="Write cost per fsync mode")
+    durability_parser.add_argument("--items", type=int, default=500, help="Items in the inbox")
+    durability_parser.add_argument("--batch", type=int, default=50, help="Items per add_batch")
+    durability_parser.add_argument("--repeat", type=int, default=10, help="Samples per operation")
+    durability_parser.set_defaults(func=bench_durability)
+
+    backends_parser = subparsers.add_parser("backends", help="Storage backend throughput")
+    backends_parser.add_argument(
+        "--backends", nargs="+", default=inbox.BACKENDS, choices=inbox.BACKENDS
+    )
+    backends_parser.add_argument("--producers", type=int, default=4, help="Adding processes")
+    backends_parser.add_argument("--consumers", type=int, default=4, help="Claiming processes")
+    backends_parser.add_argument("--items", type=int, default=250, help="Items per producer")
+    backends_parser.set_defaults(func=bench_backends)
+
+    contention_parser = subparsers.add_parser(
+        "contention", help="Producers and consumers on one inbox; verifies no loss/duplicates"
+    )
+    contention_parser.add_argument(
+        "--backends", nargs="+", default=["markdown"], choices=inbox.BACKENDS
+    )
+    contention_parser.add_argument("--producers", type=int, default=4, help="Adding processes")
+    contention_parser.add_argument("--consumers", type=int, default=4, help="Consuming processes")
+    contention_parser.add_argument("--items", type=int, default=200, help="Messages per producer")
+    contention_parser.add_argument(
+        "--mode",
+        choices=["take", "claim"],
+        default="take",
+        help="take: atomic take; claim: peek then claim (races are counted)",
+    )
+    contention_parser.add_argument(
+        "--rate", type=float, default=0, help="Messages/s per producer (0 = as fast as possible)"
+    )
+    contention_parser.add_argument(
+        "--lock-timeout",
+        type=float,
+        default=inbox.LOCK_TIMEOUT,
+        help=f"Seconds before a lock wait counts as a timeout (default {inbox.LOCK_TIMEOUT})",
+    )
+    contention_parser.set_defaults(func=bench_contention)
+
+    suite_parser = subparsers.add_parser("suite", help="Engine paths across sizes, bodies and claim mix")
+    suite_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 1000, 100000], help="Inbox sizes (items)"
+    )
+    suite_parser.add_argument(
+        "--bodies", type=int, nargs="+", default=[200, 4096], help="Body sizes (bytes)"
+    )
+    suite_parser.add_argument(
+        "--claimed", type=int, default=50, help="Percent of items claimed (default 50)"
+    )
+    suite_parser.add_argument("--ops", nargs="+", default=SUITE_OPS, choices=SUITE_OPS)
+    suite_parser.add_argument("--backend", default="markdown", choices=inbox.BACKENDS)
+    suite_parser.add_argument("--repeat", type=int, default=5, help="Samples per combination")
+    suite_parser.add_argument(
+        "--max-mb", type=int, default=128, help="Skip combinations with more body text than this"
+    )
+    suite_parser.set_defaults(func=bench_suite)
+
+    compare_parser = subparsers.add_parser("compare", help="p50 ratios between two --json runs")
+    compare_parser.add_argument("old", help="Baseline rows (JSONL from --json)")
+    compare_parser.add_argument("new", help="Rows to compare against the baseline")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=1.2, help="Ratio flagged as slower/faster (exit 1 if slower)"
+    )
+    compare_parser.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        bench_compare(args)
+        return
+    print_rows(args.func(args), args.json)
+
+
+if __name__ == "__main__":
+    main()